@@ -0,0 +1,148 @@
+import subprocess
+from typing import Iterator, Optional, Tuple
+import numpy as np
+from Setting import *
+
+
+def probe_duration(path: str) -> float:
+    """Ritorna la durata in secondi del file audio senza decodificarlo."""
+    try:
+        result = subprocess.run(
+            [
+                "ffprobe", "-v", "error",
+                "-show_entries", "format=duration",
+                "-of", "default=noprint_wrappers=1:nokey=1",
+                path
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            check=False
+        )
+        if result.returncode == 0 and result.stdout.strip():
+            return float(result.stdout.strip())
+        logger.warning(f"ffprobe non ha restituito la durata di {path}: {result.stderr.strip()}")
+    except (FileNotFoundError, ValueError) as e:
+        logger.warning(f"ffprobe non disponibile o output non valido: {e}")
+
+    # Fallback: librosa legge solo l'header per i formati supportati da soundfile
+    import librosa
+    return float(librosa.get_duration(path=path))
+
+
+class AudioStream:
+    """
+    Decodifica un file audio tramite una pipe ffmpeg (PCM float32 mono) e lo
+    restituisce a finestre di dimensione fissa, così la memoria occupata
+    dall'audio non dipende dalla durata del file.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        window_seconds: float = STREAM_WINDOW_SECONDS,
+        sample_rate: int = SAMPLE_RATE,
+        split_search_seconds: float = STREAM_SPLIT_SEARCH_SECONDS
+    ):
+        self.path = path
+        self.sample_rate = sample_rate
+        self._window_samples = int(window_seconds * sample_rate)
+        self._search_samples = min(int(split_search_seconds * sample_rate), self._window_samples // 2)
+        self._frame_samples = int(0.1 * sample_rate)
+        self._process: Optional[subprocess.Popen] = None
+
+    def __enter__(self) -> 'AudioStream':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _open(self) -> subprocess.Popen:
+        return subprocess.Popen(
+            [
+                "ffmpeg", "-nostdin", "-v", "error",
+                "-i", self.path,
+                "-f", "f32le", "-acodec", "pcm_f32le",
+                "-ac", "1", "-ar", str(self.sample_rate),
+                "-"
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=0
+        )
+
+    def close(self):
+        """Termina il processo ffmpeg se ancora attivo."""
+        if self._process is None:
+            return
+        try:
+            if self._process.stdout:
+                self._process.stdout.close()
+            if self._process.poll() is None:
+                self._process.kill()
+            self._process.wait()
+        except Exception:
+            logger.exception("Errore chiusura processo ffmpeg")
+        self._process = None
+
+    def _read_samples(self, count: int) -> np.ndarray:
+        assert self._process is not None and self._process.stdout is not None
+        wanted = count * 4
+        chunks = []
+        while wanted > 0:
+            data = self._process.stdout.read(wanted)
+            if not data:
+                break
+            chunks.append(data)
+            wanted -= len(data)
+        buffer = b"".join(chunks)
+        # scarta eventuali byte spuri di un campione incompleto
+        buffer = buffer[:len(buffer) - len(buffer) % 4]
+        return np.frombuffer(buffer, dtype=np.float32)
+
+    def _check_exit(self):
+        """Solleva un errore se ffmpeg è terminato senza successo (file illeggibile)."""
+        assert self._process is not None
+        code = self._process.wait()
+        if code != 0:
+            raise RuntimeError(f"ffmpeg non è riuscito a decodificare {self.path} (codice {code})")
+
+    def _split_point(self, audio: np.ndarray) -> int:
+        """Indice del frame più silenzioso nella coda della finestra, per non tagliare una parola."""
+        if self._search_samples < self._frame_samples:
+            return len(audio)
+        tail = audio[-self._search_samples:]
+        frames = len(tail) // self._frame_samples
+        if frames == 0:
+            return len(audio)
+        energy = np.square(tail[:frames * self._frame_samples]).reshape(frames, -1).mean(axis=1)
+        quietest = int(np.argmin(energy))
+        return len(audio) - len(tail) + quietest * self._frame_samples + self._frame_samples // 2
+
+    def windows(self) -> Iterator[Tuple[float, np.ndarray]]:
+        """Restituisce coppie (offset in secondi, campioni) fino alla fine del file."""
+        self.close()
+        self._process = self._open()
+        carry = np.zeros(0, dtype=np.float32)
+        position = 0
+        try:
+            while True:
+                fresh = self._read_samples(self._window_samples - len(carry))
+                audio = np.concatenate((carry, fresh)) if len(carry) else fresh
+                if len(fresh) < self._window_samples - len(carry):
+                    self._check_exit()
+                if len(audio) == 0:
+                    break
+
+                if len(audio) < self._window_samples:
+                    # ultima finestra
+                    yield position / self.sample_rate, audio
+                    break
+
+                cut = self._split_point(audio)
+                # copia la coda: la finestra corrente può essere rilasciata dal chiamante
+                carry = audio[cut:].copy()
+                yield position / self.sample_rate, audio[:cut]
+                position += cut
+        finally:
+            self.close()
@@ -0,0 +1,440 @@
+import importlib.util
+from abc import ABC, abstractmethod
+import random
+import time
+from collections import namedtuple
+from dataclasses import asdict, dataclass, field
+from math import ceil
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type
+import numpy as np
+from Setting import *
+
+
+# Segmento nel formato comune a tutti i motori (gli oggetti di faster-whisper hanno gli stessi attributi)
+Segment = namedtuple("Segment", ["start", "end", "text", "avg_logprob", "compression_ratio", "no_speech_prob"])
+
+
+@dataclass
+class EngineInfo:
+    language: Optional[str]
+    language_probability: float
+    duration: float
+
+
+@dataclass(frozen=True)
+class EngineCapabilities:
+    # decodifica di più porzioni dell'audio in parallelo (ENGINE_BATCH_SIZE > 1)
+    batching: bool = False
+    word_timestamps: bool = False
+    # VAD interno alla decodifica (vad_filter); senza, si usano solo le mappe del parlato
+    vad: bool = False
+    # segmenti restituiti man mano durante la decodifica invece che tutti alla fine
+    streaming: bool = False
+    # encode() calcola l'uscita dell'encoder una volta e decode() esegue solo il decoder
+    # (negli sweep; senza, ogni decode() ripete l'intera trascrizione)
+    shared_encoding: bool = False
+    compute_types: Tuple[str, ...] = ("default",)
+
+
+@dataclass
+class EncodedAudio:
+    """
+    Finestra preparata da Engine.encode() per più decodifiche. Nell'implementazione
+    di base contiene solo l'audio e gli argomenti di transcribe(); i motori con
+    shared_encoding vi conservano l'uscita dell'encoder (data).
+    """
+    audio: Any
+    arguments: dict
+    language: Optional[str] = None
+    duration: float = 0.0
+    data: Any = field(default=None, repr=False)
+
+
+class Engine(ABC):
+    """
+    Motore di trascrizione. Ogni implementazione carica il proprio modello nel
+    costruttore e decodifica una finestra di audio (float32 mono a SAMPLE_RATE)
+    con transcribe(), che ritorna (segmenti, info) come WhisperModel.transcribe:
+    i segmenti hanno start/end relativi alla finestra. Il pacchetto Python del
+    motore (module) viene importato solo quando il motore viene creato.
+    """
+
+    name: str = ""
+    module: Optional[str] = None
+    capabilities: EngineCapabilities = EngineCapabilities()
+
+    def __init__(self, model_name: str, device: str = "cpu", compute_type: str = COMPUTE_TYPE,
+                 cpu_threads: int = 4, workers: int = 1):
+        if compute_type not in self.capabilities.compute_types:
+            logger.warning(f"compute_type '{compute_type}' non supportato da {self.name}, uso 'default'.")
+            compute_type = "default"
+        self.model_name = model_name
+        self.device = device
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads
+        self.workers = workers
+
+    @classmethod
+    def available(cls) -> bool:
+        return cls.module is None or importlib.util.find_spec(cls.module) is not None
+
+    @abstractmethod
+    def transcribe(
+        self,
+        audio,
+        language: Optional[str] = None,
+        beam_size: int = 5,
+        temperature: float = 0.0,
+        vad_filter: bool = False,
+        vad_parameters: Optional[dict] = None,
+        clip_timestamps: Optional[List[float]] = None,
+        compression_ratio_threshold: float = 2.4,
+        no_repeat_ngram_size: int = 0,
+        best_of: int = 5,
+        patience: float = 1.0
+    ) -> Tuple[Iterable, EngineInfo]:
+        """
+        clip_timestamps, se presente, limita la decodifica agli intervalli
+        [inizio, fine, inizio, fine, ...] (secondi dall'inizio della finestra) e
+        sostituisce il VAD.
+        """
+
+    def encode(self, audio, language: Optional[str] = None, vad_filter: bool = False,
+               vad_parameters: Optional[dict] = None, clip_timestamps: Optional[List[float]] = None) -> EncodedAudio:
+        """Prepara la finestra per più decode() con configurazioni diverse (sweep)."""
+        return EncodedAudio(
+            audio=audio,
+            arguments=dict(language=language, vad_filter=vad_filter, vad_parameters=vad_parameters,
+                           clip_timestamps=clip_timestamps),
+            language=language,
+            duration=len(audio) / SAMPLE_RATE
+        )
+
+    def decode(self, encoded: EncodedAudio, beam_size: int = 5, temperature: float = 0.0,
+               compression_ratio_threshold: float = 2.4, no_repeat_ngram_size: int = 0,
+               best_of: int = 5, patience: float = 1.0) -> Tuple[Iterable, EngineInfo]:
+        """Decodifica una finestra preparata da encode(); come transcribe() senza encoder condiviso."""
+        return self.transcribe(
+            encoded.audio,
+            beam_size=beam_size,
+            temperature=temperature,
+            compression_ratio_threshold=compression_ratio_threshold,
+            no_repeat_ngram_size=no_repeat_ngram_size,
+            best_of=best_of,
+            patience=patience,
+            **encoded.arguments
+        )
+
+
+class FasterWhisperEngine(Engine):
+    name = "faster-whisper"
+    module = "faster_whisper"
+    capabilities = EngineCapabilities(
+        batching=True,
+        word_timestamps=True,
+        vad=True,
+        streaming=True,
+        shared_encoding=True,
+        compute_types=("default", "auto", "int8", "int8_float16", "int8_float32", "int16", "float16", "bfloat16", "float32")
+    )
+
+    # durata massima di una porzione nella decodifica a batch (finestra di Whisper)
+    CHUNK_SECONDS: Final[int] = 30
+    # soglie con cui generate_segments scarta una porzione come silenzio
+    NO_SPEECH_THRESHOLD: Final[float] = 0.6
+    LOG_PROB_THRESHOLD: Final[float] = -1.0
+
+    def __init__(self, model_name: str, device: str = "cpu", compute_type: str = COMPUTE_TYPE,
+                 cpu_threads: int = 4, workers: int = 1, batch_size: int = ENGINE_BATCH_SIZE):
+        super().__init__(model_name, device, compute_type, cpu_threads, workers)
+        from faster_whisper import WhisperModel
+
+        #https://developer.nvidia.com/rdp/cudnn-archive
+        self._model = WhisperModel(
+            model_size_or_path=model_name,
+            device=device,
+            device_index=0,
+            compute_type=self.compute_type,
+            cpu_threads=cpu_threads,
+            num_workers=workers
+        )
+        self._batch_size = batch_size
+        self._batched = None
+        if batch_size > 1:
+            from faster_whisper import BatchedInferencePipeline
+            self._batched = BatchedInferencePipeline(model=self._model)
+
+    def _chunks(self, clips: List[float]) -> List[dict]:
+        """Intervalli (in campioni) per la pipeline a batch, spezzati in porzioni di al più CHUNK_SECONDS."""
+        chunks = []
+        for start, end in zip(clips[0::2], clips[1::2]):
+            while end - start > 0:
+                stop = min(end, start + self.CHUNK_SECONDS)
+                chunks.append({"start": int(start * SAMPLE_RATE), "end": int(stop * SAMPLE_RATE)})
+                start = stop
+        return chunks
+
+    def transcribe(self, audio, language=None, beam_size=5, temperature=0.0, vad_filter=False,
+                   vad_parameters=None, clip_timestamps=None, compression_ratio_threshold=2.4, no_repeat_ngram_size=0,
+                   best_of=5, patience=1.0):
+        options = dict(
+            language=language,
+            task="transcribe",
+            beam_size=beam_size,
+            temperature=[temperature],
+            compression_ratio_threshold=compression_ratio_threshold,
+            no_repeat_ngram_size=no_repeat_ngram_size,
+            best_of=best_of,
+            patience=patience,
+        )
+
+        if self._batched is not None:
+            if not clip_timestamps and not vad_filter:
+                # senza VAD la pipeline a batch richiede comunque gli intervalli da decodificare
+                clip_timestamps = [0.0, len(audio) / SAMPLE_RATE]
+            return self._batched.transcribe(
+                audio,
+                batch_size=self._batch_size,
+                vad_filter=vad_filter and not clip_timestamps,
+                vad_parameters=vad_parameters,
+                clip_timestamps=self._chunks(clip_timestamps) if clip_timestamps else None,
+                **options
+            )
+
+        if clip_timestamps:
+            return self._model.transcribe(audio, vad_filter=False, clip_timestamps=clip_timestamps, **options)
+        return self._model.transcribe(audio, vad_filter=vad_filter, vad_parameters=vad_parameters, **options)
+
+    def encode(self, audio, language=None, vad_filter=False, vad_parameters=None, clip_timestamps=None):
+        """
+        Divide la finestra in porzioni fisse di al più CHUNK_SECONDS (gli intervalli di
+        clip_timestamps, oppure l'intera finestra) e ne calcola una volta l'uscita
+        dell'encoder, a gruppi di ENGINE_BATCH_SIZE. Con il VAD interno le porzioni
+        dipendono dalla decodifica e si ripiega sull'implementazione di base.
+        """
+        if vad_filter and not clip_timestamps:
+            return super().encode(audio, language, vad_filter, vad_parameters, clip_timestamps)
+        from faster_whisper.audio import pad_or_trim
+        from faster_whisper.tokenizer import Tokenizer
+
+        duration = len(audio) / SAMPLE_RATE
+        chunks = self._chunks(clip_timestamps or [0.0, duration])
+        batch_size = max(1, self._batch_size)
+        batches = []
+        for i in range(0, len(chunks), batch_size):
+            group = chunks[i:i + batch_size]
+            features = np.stack([
+                pad_or_trim(self._model.feature_extractor(audio[chunk["start"]:chunk["end"]])[..., :-1])
+                for chunk in group
+            ])
+            batches.append((group, self._model.encode(features)))
+
+        if language is None:
+            language = "en"
+            if self._model.model.is_multilingual and batches:
+                # lingua più probabile sulla prima porzione, come nella trascrizione normale
+                token, _ = self._model.model.detect_language(batches[0][1])[0][0]
+                language = token[2:-2]
+
+        tokenizer = Tokenizer(self._model.hf_tokenizer, self._model.model.is_multilingual,
+                              task="transcribe", language=language)
+        return EncodedAudio(audio=audio, arguments={}, language=language, duration=duration,
+                            data=(tokenizer, batches))
+
+    def decode(self, encoded, beam_size=5, temperature=0.0, compression_ratio_threshold=2.4,
+               no_repeat_ngram_size=0, best_of=5, patience=1.0):
+        """
+        Solo decoder sull'uscita dell'encoder di encode(), porzione per porzione come la
+        pipeline a batch: niente condizionamento sul testo precedente né ripiego su altre
+        temperature, quindi compression_ratio_threshold non ha effetto.
+        """
+        if encoded.data is None:
+            return super().decode(encoded, beam_size, temperature, compression_ratio_threshold,
+                                  no_repeat_ngram_size, best_of, patience)
+        info = EngineInfo(language=encoded.language, language_probability=1.0, duration=encoded.duration)
+        return self._decode_chunks(encoded, beam_size, temperature, no_repeat_ngram_size, best_of, patience), info
+
+    def _decode_chunks(self, encoded, beam_size, temperature, no_repeat_ngram_size, best_of, patience):
+        from faster_whisper.transcribe import get_compression_ratio, get_suppressed_tokens
+
+        tokenizer, batches = encoded.data
+        prompt = self._model.get_prompt(tokenizer, [], without_timestamps=False)
+        suppress_tokens = get_suppressed_tokens(tokenizer, [-1])
+        if temperature == 0:
+            search = dict(beam_size=beam_size, patience=patience)
+        else:
+            # campionamento come generate_with_fallback: best_of ipotesi, si tiene la migliore
+            search = dict(beam_size=1, num_hypotheses=best_of, sampling_topk=0, sampling_temperature=temperature)
+
+        for group, encoder_output in batches:
+            results = self._model.model.generate(
+                encoder_output,
+                [list(prompt) for _ in group],
+                length_penalty=1,
+                max_length=self._model.max_length,
+                suppress_blank=True,
+                suppress_tokens=suppress_tokens,
+                return_scores=True,
+                return_no_speech_prob=True,
+                no_repeat_ngram_size=no_repeat_ngram_size,
+                **search
+            )
+            for chunk, result in zip(group, results):
+                tokens = result.sequences_ids[0]
+                avg_logprob = result.scores[0] * len(tokens) / (len(tokens) + 1)
+                if result.no_speech_prob > self.NO_SPEECH_THRESHOLD and avg_logprob < self.LOG_PROB_THRESHOLD:
+                    continue
+                offset = chunk["start"] / SAMPLE_RATE
+                duration = (chunk["end"] - chunk["start"]) / SAMPLE_RATE
+                pieces, _, _ = self._model._split_segments_by_timestamps(
+                    tokenizer=tokenizer,
+                    tokens=tokens,
+                    time_offset=offset,
+                    segment_size=int(ceil(duration) * self._model.frames_per_second),
+                    segment_duration=duration,
+                    seek=0
+                )
+                for piece in pieces:
+                    text = tokenizer.decode(piece["tokens"])
+                    if not text.strip():
+                        continue
+                    yield Segment(
+                        start=round(piece["start"], 3),
+                        end=round(piece["end"], 3),
+                        text=text,
+                        avg_logprob=avg_logprob,
+                        compression_ratio=get_compression_ratio(text),
+                        no_speech_prob=result.no_speech_prob
+                    )
+
+
+class OpenAIWhisperEngine(Engine):
+    """
+    Implementazione di riferimento openai-whisper. Non ha VAD interno e
+    restituisce i segmenti solo a decodifica conclusa; no_repeat_ngram_size
+    non è supportato e viene ignorato. Gli intervalli di clip_timestamps sono
+    decodificati separatamente e i tempi riportati alla finestra.
+    """
+
+    name = "openai-whisper"
+    module = "whisper"
+    capabilities = EngineCapabilities(
+        word_timestamps=True,
+        compute_types=("default", "float16", "float32")
+    )
+
+    def __init__(self, model_name: str, device: str = "cpu", compute_type: str = COMPUTE_TYPE,
+                 cpu_threads: int = 4, workers: int = 1):
+        super().__init__(model_name, device, compute_type, cpu_threads, workers)
+        import whisper
+
+        self._model = whisper.load_model(model_name, device=device)
+        # float16 solo su GPU
+        self._fp16 = device == "cuda" and self.compute_type in ("default", "float16")
+
+    def transcribe(self, audio, language=None, beam_size=5, temperature=0.0, vad_filter=False,
+                   vad_parameters=None, clip_timestamps=None, compression_ratio_threshold=2.4, no_repeat_ngram_size=0,
+                   best_of=5, patience=1.0):
+        duration = len(audio) / SAMPLE_RATE
+        clips = clip_timestamps or [0.0, duration]
+        info = EngineInfo(language=language, language_probability=1.0, duration=duration)
+
+        segments = []
+        for start, end in zip(clips[0::2], clips[1::2]):
+            result = self._model.transcribe(
+                audio[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)],
+                language=info.language,
+                task="transcribe",
+                # beam search (beam_size, patience) con temperatura 0, altrimenti campionamento (best_of)
+                beam_size=beam_size if temperature == 0 else None,
+                patience=patience if temperature == 0 else None,
+                best_of=best_of if temperature != 0 else None,
+                temperature=(temperature,),
+                compression_ratio_threshold=compression_ratio_threshold,
+                fp16=self._fp16,
+                verbose=None
+            )
+            # la lingua rilevata nel primo intervallo vale per i successivi
+            info.language = info.language or result.get("language")
+            for s in result["segments"]:
+                segments.append(Segment(
+                    start=start + s["start"],
+                    end=start + s["end"],
+                    text=s["text"],
+                    avg_logprob=s["avg_logprob"],
+                    compression_ratio=s["compression_ratio"],
+                    no_speech_prob=s["no_speech_prob"]
+                ))
+        return iter(segments), info
+
+
+class StubEngine(Engine):
+    """
+    Motore deterministico per i test di carico: non carica alcun modello e
+    restituisce segmenti sintetici di 2-8 secondi che coprono l'audio (o gli
+    intervalli di clip_timestamps), rispettando il fattore real-time
+    configurato. A parità di audio e parametri produce sempre lo stesso testo.
+    """
+
+    name = "stub"
+    capabilities = EngineCapabilities(streaming=True)
+
+    WORDS = ("lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit",
+             "sed", "do", "eiusmod", "tempor", "incididunt", "ut", "labore", "et", "dolore", "magna")
+
+    def __init__(self, model_name: str, device: str = "cpu", compute_type: str = COMPUTE_TYPE,
+                 cpu_threads: int = 4, workers: int = 1, real_time_factor: float = STUB_REAL_TIME_FACTOR):
+        super().__init__(model_name, device, compute_type, cpu_threads, workers)
+        self.real_time_factor = real_time_factor
+
+    def transcribe(self, audio, language=None, beam_size=5, temperature=0.0, vad_filter=False,
+                   vad_parameters=None, clip_timestamps=None, compression_ratio_threshold=2.4, no_repeat_ngram_size=0,
+                   best_of=5, patience=1.0):
+        duration = len(audio) / SAMPLE_RATE
+        rng = random.Random(f"{self.model_name}-{len(audio)}-{beam_size}-{temperature}-{best_of}-{patience}")
+        info = EngineInfo(language=language or "it", language_probability=1.0, duration=duration)
+        clips = clip_timestamps or [0.0, duration]
+        return self._segments(list(zip(clips[0::2], clips[1::2])), rng), info
+
+    def _segments(self, ranges: List[tuple], rng: random.Random):
+        for position, duration in ranges:
+            while position < duration:
+                end = min(duration, position + rng.uniform(2.0, 8.0))
+                time.sleep((end - position) * self.real_time_factor)
+                words = [rng.choice(self.WORDS) for _ in range(max(1, int((end - position) * 2.5)))]
+                yield Segment(
+                    start=position,
+                    end=end,
+                    text=" " + " ".join(words),
+                    avg_logprob=-rng.uniform(0.1, 0.6),
+                    compression_ratio=rng.uniform(1.2, 2.0),
+                    no_speech_prob=rng.uniform(0.0, 0.1)
+                )
+                position = end
+
+
+ENGINES: Final[Dict[str, Type[Engine]]] = {
+    engine.name: engine for engine in (FasterWhisperEngine, OpenAIWhisperEngine, StubEngine)
+}
+
+
+def engine_for(model_name: str, requested: Optional[str] = None) -> str:
+    """Motore da usare: quello richiesto dal job, altrimenti quello configurato per il modello, altrimenti il predefinito."""
+    return requested or MODEL_ENGINES.get(model_name) or TRANSCRIPTION_ENGINE
+
+
+def create_engine(name: str, model_name: str, **kwargs) -> Engine:
+    if name not in ENGINES:
+        raise ValueError(f"Motore di trascrizione non supportato: {name}")
+    engine = ENGINES[name]
+    if not engine.available():
+        raise RuntimeError(f"Motore {name} non installato (modulo '{engine.module}')")
+    return engine(model_name, **kwargs)
+
+
+def describe_engines() -> dict:
+    """Motori registrati con disponibilità e capacità, per /health."""
+    return {
+        name: {"available": engine.available(), "capabilities": asdict(engine.capabilities)}
+        for name, engine in ENGINES.items()
+    }
@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from Setting import *
+from Ingest import is_allowed_audio
+from Transcriber import QueueItem
+
+
+@dataclass
+class WatchedFolder:
+    path: str
+    output: str
+    recursive: bool = True
+    parameters: dict = field(default_factory=dict)
+
+
+def load_watch_config(config_path: str = WATCH_CONFIG) -> List[WatchedFolder]:
+    """Legge la configurazione delle cartelle monitorate (lista vuota se il file non esiste)."""
+    if not os.path.exists(config_path):
+        return []
+
+    with open(config_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    folders = []
+    for entry in data:
+        folders.append(WatchedFolder(
+            path=os.path.realpath(entry["path"]),
+            output=os.path.realpath(entry["output"]),
+            recursive=bool(entry.get("recursive", True)),
+            parameters=dict(entry.get("parameters", {}))
+        ))
+    return folders
+
+
+class FolderWatcher:
+    """
+    Scansiona periodicamente le cartelle configurate e accoda i nuovi file audio
+    direttamente dal loro percorso, quando dimensione e data di modifica sono
+    rimaste invariate tra due scansioni. I file già accodati sono registrati in
+    un file di registro in STATE_DIR, così non vengono mai accodati due volte,
+    anche dopo un riavvio.
+    """
+
+    def __init__(
+        self,
+        folders: List[WatchedFolder],
+        enqueue: Callable[[List[QueueItem]], List[QueueItem]],
+        parse_parameters: Callable[[dict], dict],
+        interval: float = WATCH_SCAN_INTERVAL,
+        stable_seconds: float = WATCH_STABLE_SECONDS,
+        ledger_path: str = os.path.join(STATE_DIR, "watch_ledger.txt")
+    ):
+        self._folders = folders
+        self._enqueue = enqueue
+        self._parse_parameters = parse_parameters
+        self._interval = interval
+        self._stable_seconds = stable_seconds
+        self._ledger_path = ledger_path
+        self._seen: Set[str] = self._load_ledger()
+        # percorso -> (dimensione, mtime_ns) osservati nella scansione precedente
+        self._candidates: Dict[str, Tuple[int, int]] = {}
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _load_ledger(self) -> Set[str]:
+        if not os.path.exists(self._ledger_path):
+            return set()
+        with open(self._ledger_path, "r", encoding="utf-8") as f:
+            return {line.rstrip("\n") for line in f if line.strip()}
+
+    def _append_ledger(self, paths: List[str]):
+        with open(self._ledger_path, "a", encoding="utf-8") as f:
+            f.write("".join(p + "\n" for p in paths))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def start(self):
+        if self._thread is not None:
+            return
+        for folder in self._folders:
+            logger.info(f"📂 Cartella monitorata: {folder.path} -> {folder.output}")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            for folder in self._folders:
+                try:
+                    self.scan(folder)
+                except Exception:
+                    logger.exception(f"Errore durante la scansione di {folder.path}")
+            self._stop_event.wait(self._interval)
+
+    def _iter_files(self, folder: WatchedFolder):
+        """Restituisce (percorso, stat) dei file audio non ancora accodati, senza ricorsione Python."""
+        stack = [folder.path]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        # file nascosti o temporanei (copie in corso)
+                        if entry.name.startswith("."):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            if folder.recursive:
+                                stack.append(entry.path)
+                            continue
+                        if entry.path in self._seen or not is_allowed_audio(entry.name):
+                            continue
+                        try:
+                            yield entry.path, entry.stat()
+                        except FileNotFoundError:
+                            continue
+            except (FileNotFoundError, PermissionError) as e:
+                logger.warning(f"Cartella non accessibile {directory}: {e}")
+
+    def scan(self, folder: WatchedFolder) -> int:
+        """Esegue una scansione della cartella e ritorna il numero di file accodati."""
+        now = time.time()
+        stable: List[str] = []
+        observed: Dict[str, Tuple[int, int]] = {}
+
+        for path, stat in self._iter_files(folder):
+            signature = (stat.st_size, stat.st_mtime_ns)
+            observed[path] = signature
+            if self._candidates.get(path) == signature and now - stat.st_mtime >= self._stable_seconds:
+                stable.append(path)
+
+        # i candidati spariti dalla cartella vengono dimenticati
+        for path in [p for p in self._candidates if p.startswith(folder.path + os.sep) and p not in observed]:
+            del self._candidates[path]
+        self._candidates.update(observed)
+
+        if not stable:
+            return 0
+
+        parameters = self._parse_parameters(folder.parameters)
+        items = []
+        for path in sorted(stable):
+            relative = os.path.relpath(path, folder.path)
+            items.append(QueueItem(
+                id=str(uuid.uuid4()),
+                filename=os.path.basename(path),
+                file_path=path,
+                owns_file=False,
+                output_path=os.path.join(folder.output, os.path.splitext(relative)[0] + ".txt"),
+                **parameters
+            ))
+
+        accepted = self._enqueue(items)
+        if accepted:
+            # quelli rifiutati (coda piena) restano candidati e vengono riproposti alla prossima scansione
+            paths = [item.file_path for item in accepted]
+            self._append_ledger(paths)
+            self._seen.update(paths)
+            for path in paths:
+                self._candidates.pop(path, None)
+            logger.info(f"📂 {folder.path}: {len(accepted)} nuovi file accodati.")
+        return len(accepted)
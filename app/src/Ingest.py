@@ -0,0 +1,41 @@
+import os
+from urllib.parse import unquote, urlparse
+from Setting import *
+
+
+def is_allowed_audio(filename: str) -> bool:
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def is_inside_roots(path: str, roots: list = INGEST_ROOTS) -> bool:
+    """Controlla che il percorso (già risolto) si trovi in una delle cartelle consentite."""
+    return any(path == root or path.startswith(root.rstrip(os.sep) + os.sep) for root in roots)
+
+
+def resolve_source(source: str) -> str:
+    """
+    Converte una voce del manifest in un percorso locale senza copiare il file.
+    Sono accettati percorsi assoluti, URL file:// e URL store:// (relativi a OBJECT_STORE_DIR).
+    Solleva ValueError se la sorgente non è valida o non è consentita.
+    """
+    if not source:
+        raise ValueError("Sorgente vuota")
+
+    if source.startswith("store://"):
+        path = os.path.join(OBJECT_STORE_DIR, unquote(source[len("store://"):]).lstrip("/"))
+    elif source.startswith("file://"):
+        path = unquote(urlparse(source).path)
+    elif "://" in source:
+        raise ValueError(f"Schema non supportato: {source}")
+    else:
+        path = source
+
+    path = os.path.realpath(path)
+
+    if not is_inside_roots(path):
+        raise ValueError(f"Percorso non consentito: {source}")
+    if not is_allowed_audio(path):
+        raise ValueError(f"Formato non supportato: {source}")
+    if not os.path.isfile(path):
+        raise ValueError(f"File non trovato: {source}")
+    return path
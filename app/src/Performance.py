@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from Setting import *
+import TranscriptStorage
+
+
+# modelli in ordine di accuratezza crescente
+MODELS_BY_ACCURACY: Final[List[str]] = list(SUPPORTED_MODELS)
+
+
+class PerformanceModel:
+    """
+    Stima il tempo di elaborazione dei job a partire dal fattore real-time
+    (secondi di elaborazione per secondo di audio) misurato per ogni modello.
+    Le misure sono salvate in uno storico persistente per device, così le stime
+    restano valide dopo un riavvio. Finché un modello non è mai stato eseguito
+    su questo host si usano i valori di DEFAULT_REAL_TIME_FACTORS.
+    """
+
+    def __init__(self, device: str, smoothing: float = 0.3, history_path: str = PERFORMANCE_HISTORY_PATH):
+        self._device = device
+        self._smoothing = smoothing
+        self._history_path = history_path
+        self._lock = threading.Lock()
+        # device -> modello -> {"rtf": ..., "samples": [...], "updated_at": ...}
+        self._history: Dict[str, Dict[str, dict]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, dict]]:
+        if not os.path.exists(self._history_path):
+            return {}
+        try:
+            with open(self._history_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Storico prestazioni non leggibile ({self._history_path}): {e}")
+            return {}
+
+    def _save(self):
+        try:
+            TranscriptStorage.write_text_atomic(self._history_path, json.dumps(self._history, indent=2))
+        except Exception:
+            logger.exception("Errore salvataggio storico prestazioni")
+
+    def _default_real_time_factor(self, model: str) -> float:
+        defaults = DEFAULT_REAL_TIME_FACTORS.get(self._device, DEFAULT_REAL_TIME_FACTORS["cpu"])
+        return defaults.get(model, max(defaults.values()))
+
+    def real_time_factor(self, model: str) -> float:
+        with self._lock:
+            entry = self._history.get(self._device, {}).get(model)
+            if entry is not None:
+                return entry["rtf"]
+        return self._default_real_time_factor(model)
+
+    def estimate(self, model: str, duration: float) -> float:
+        """Secondi di elaborazione stimati per un audio di durata duration."""
+        return duration * self.real_time_factor(model)
+
+    def record(self, model: str, audio_seconds: float, elapsed_seconds: float):
+        """
+        Aggiorna la stima con una misura reale (media mobile esponenziale) e la salva nello
+        storico. La prima misura di un modello parte dal valore di DEFAULT_REAL_TIME_FACTORS,
+        così un singolo job breve non sostituisce del tutto la stima.
+        """
+        if audio_seconds <= 0 or elapsed_seconds <= 0:
+            return
+        measured = elapsed_seconds / audio_seconds
+        with self._lock:
+            models = self._history.setdefault(self._device, {})
+            entry = models.get(model)
+            if entry is None:
+                entry = models[model] = {"rtf": self._default_real_time_factor(model), "samples": []}
+            entry["rtf"] += self._smoothing * (measured - entry["rtf"])
+            entry["samples"] = (entry["samples"] + [round(measured, 5)])[-PERFORMANCE_HISTORY_SAMPLES:]
+            entry["updated_at"] = time.time()
+            rtf = entry["rtf"]
+            self._save()
+        logger.info(f"Fattore real-time {model} ({self._device}): {rtf:.3f}")
+
+    def snapshot(self) -> dict:
+        """Fattori real-time correnti per tutti i modelli supportati."""
+        return {model: self.real_time_factor(model) for model in MODELS_BY_ACCURACY}
+
+    def choose_model(
+        self,
+        finish_after: Callable[[str], float],
+        deadline: Optional[float],
+        min_model: Optional[str] = None,
+        now: Optional[float] = None
+    ) -> Tuple[str, bool]:
+        """
+        Sceglie il modello più accurato (non meno accurato di min_model) che termina
+        entro deadline (epoch). finish_after(modello) ritorna i secondi da ora alla fine
+        del job con quel modello, comprese l'attesa in coda e tutte le passate (bozza,
+        configurazioni di uno sweep). Senza scadenza sceglie min_model, cioè la qualità
+        minima accettabile più veloce. Se nessun modello rispetta la scadenza ritorna il
+        più veloce ammesso. Ritorna (modello, scadenza_rispettata).
+        """
+        candidates = MODELS_BY_ACCURACY
+        if min_model in MODELS_BY_ACCURACY:
+            candidates = MODELS_BY_ACCURACY[MODELS_BY_ACCURACY.index(min_model):]
+
+        if deadline is None:
+            return candidates[0], True
+
+        now = time.time() if now is None else now
+        for model in reversed(candidates):
+            if now + finish_after(model) <= deadline:
+                return model, True
+        return candidates[0], False
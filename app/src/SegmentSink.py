@@ -0,0 +1,130 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable, List, Optional
+from Setting import *
+
+
+_CLOSE = object()
+
+
+class SegmentSink:
+    """
+    Riceve i segmenti dal ciclo di decodifica e ne gestisce gli effetti
+    collaterali in un thread separato: scrittura su file a blocchi, log con
+    frequenza limitata e pubblicazione del progresso. Il decoder si limita a
+    inserire una tupla in un buffer limitato e non attende I/O né l'invio
+    degli aggiornamenti ai client. Se il buffer è pieno il decoder attende
+    (il testo non viene mai scartato) e l'attesa viene conteggiata.
+    """
+
+    def __init__(
+        self,
+        output_path: str,
+        label: str,
+        formatter: Callable[[float, float, float, str], str],
+        on_progress: Optional[Callable[[int], None]] = None,
+        capacity: int = SEGMENT_BUFFER_SIZE,
+        flush_interval: float = SEGMENT_FLUSH_INTERVAL,
+        log_interval: float = SEGMENT_LOG_INTERVAL,
+        progress_interval: float = PROGRESS_UPDATE_INTERVAL
+    ):
+        self._output_path = output_path
+        self._label = label
+        self._formatter = formatter
+        self._on_progress = on_progress
+        self._flush_interval = flush_interval
+        self._log_interval = log_interval
+        self._progress_interval = progress_interval
+        self._buffer: queue.Queue = queue.Queue(maxsize=capacity)
+        self._error: Optional[BaseException] = None
+        self.segments = 0
+        self.stalls = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, start: float, end: float, progress_percent: float, text: str):
+        """Chiamato dal decoder: accoda il segmento senza eseguire I/O."""
+        entry = (start, end, progress_percent, text)
+        try:
+            self._buffer.put_nowait(entry)
+        except queue.Full:
+            self.stalls += 1
+            self._buffer.put(entry)
+
+    def close(self):
+        """Attende lo svuotamento del buffer e la chiusura del file; rilancia eventuali errori di scrittura."""
+        self._buffer.put(_CLOSE)
+        self._thread.join()
+        if self.stalls:
+            logger.warning(f"[{self._label}] buffer segmenti pieno {self.stalls} volte")
+        if self._error is not None:
+            raise self._error
+
+    def _drain(self, first) -> List:
+        entries = [first]
+        while True:
+            try:
+                entries.append(self._buffer.get_nowait())
+            except queue.Empty:
+                return entries
+
+    def _run(self):
+        last_flush = last_log = last_progress = time.monotonic()
+        published = -1
+        pending_progress = -1
+        debug = logger.isEnabledFor(logging.DEBUG)
+        # True quando _CLOSE è già stato prelevato dal buffer
+        closing = False
+
+        try:
+            with open(self._output_path, "a", encoding="utf-8") as f:
+                while not closing:
+                    try:
+                        first = self._buffer.get(timeout=self._flush_interval)
+                    except queue.Empty:
+                        first = None
+
+                    lines = []
+                    if first is not None:
+                        entries = self._drain(first)
+                        # _CLOSE è l'ultimo elemento accodato: va registrato prima di formattare,
+                        # così un errore nel blocco finale non lascia il gestore in attesa di un altro _CLOSE
+                        if entries[-1] is _CLOSE:
+                            closing = True
+                            entries.pop()
+                        for entry in entries:
+                            start, end, progress_percent, text = entry
+                            lines.append(self._formatter(start, end, progress_percent, text))
+                            pending_progress = max(pending_progress, min(100, int(progress_percent)))
+                            if debug:
+                                logger.debug(f"[{self._label}] Segment {start:.2f}s to {end:.2f}s: {text}")
+                        self.segments += len(lines)
+
+                    if lines:
+                        f.write("".join(lines))
+
+                    now = time.monotonic()
+                    if closing or now - last_flush >= self._flush_interval:
+                        f.flush()
+                        last_flush = now
+
+                    if lines and now - last_log >= self._log_interval:
+                        logger.info(f"[{self._label}] {self.segments} segmenti (Progress: {pending_progress}%)")
+                        last_log = now
+
+                    if (self._on_progress is not None and pending_progress > published
+                            and (closing or now - last_progress >= self._progress_interval)):
+                        published = pending_progress
+                        last_progress = now
+                        try:
+                            self._on_progress(published)
+                        except Exception:
+                            logger.exception("progress callback raised an exception")
+        except BaseException as e:
+            self._error = e
+            # continua a svuotare il buffer per non bloccare il decoder, finché non arriva _CLOSE
+            # (se era già nell'ultimo blocco letto, close() sta solo attendendo la fine del thread)
+            while not closing:
+                closing = self._buffer.get() is _CLOSE
@@ -1,3 +1,4 @@
+import json
 import logging
 from typing_extensions import Final
 import os
@@ -38,4 +39,89 @@ SUPPORTED_MODELS: Final[dict] = {
     "small": "Small (buona accuratezza)",
     "medium": "Medium (molto accurato)",
     "large-v3": "Large-v3 (massima accuratezza)"
-}
\ No newline at end of file
+}
+
+# Decodifica audio a finestre (memoria limitata indipendentemente dalla durata)
+SAMPLE_RATE: Final[int] = 16000
+STREAM_WINDOW_SECONDS: Final[float] = float(os.environ.get("STREAM_WINDOW_SECONDS", 600))
+# Porzione finale di ogni finestra in cui cercare il punto più silenzioso per il taglio
+STREAM_SPLIT_SEARCH_SECONDS: Final[float] = 5.0
+
+# Compressione delle trascrizioni salvate: "none", "gzip" oppure "zstd" (richiede zstandard)
+TRANSCRIPT_COMPRESSION: Final[str] = os.environ.get("TRANSCRIPT_COMPRESSION", "none")
+
+# Archivio locale che simula un object store: gli URL store://<percorso> vengono risolti qui
+OBJECT_STORE_DIR: Final[str] = os.environ.get("OBJECT_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "object_store"))
+
+# Cartelle da cui l'API batch può leggere file direttamente (separate da os.pathsep)
+INGEST_ROOTS: Final[list] = [
+    os.path.realpath(p) for p in os.environ.get("INGEST_ROOTS", OBJECT_STORE_DIR).split(os.pathsep) if p
+]
+
+# Numero massimo di elementi attivi in coda accettati tramite l'API batch
+BATCH_MAX_QUEUE: Final[int] = int(os.environ.get("BATCH_MAX_QUEUE", 10000))
+
+# Stato persistente del servizio (registro file acquisiti, ...)
+STATE_DIR: Final[str] = os.environ.get("STATE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "state"))
+
+if not os.path.exists(STATE_DIR):
+    os.makedirs(STATE_DIR)
+
+# Cartelle monitorate: file JSON con una lista di
+# {"path": ..., "output": ..., "recursive": true, "parameters": {"model": ..., "language": ..., "vad_filter": ...}}
+WATCH_CONFIG: Final[str] = os.environ.get("WATCH_CONFIG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "watch_folders.json"))
+WATCH_SCAN_INTERVAL: Final[float] = float(os.environ.get("WATCH_SCAN_INTERVAL", 10))
+# un file è stabile se dimensione e data di modifica non cambiano tra due scansioni e sono più vecchie di così
+WATCH_STABLE_SECONDS: Final[float] = float(os.environ.get("WATCH_STABLE_SECONDS", 5))
+
+# Riepiloghi dei job sweep (una configurazione di decodifica per trascrizione)
+SWEEP_DIR: Final[str] = os.path.join(STATE_DIR, "sweeps")
+SWEEP_MAX_CONFIGS: Final[int] = int(os.environ.get("SWEEP_MAX_CONFIGS", 12))
+
+if not os.path.exists(SWEEP_DIR):
+    os.makedirs(SWEEP_DIR)
+
+# Mappe del parlato (VAD eseguito prima della trascrizione), indicizzate per hash dell'audio e parametri VAD
+SPEECHMAP_DIR: Final[str] = os.path.join(STATE_DIR, "speechmaps")
+SPEECHMAP_MEMORY_ENTRIES: Final[int] = 256
+
+if not os.path.exists(SPEECHMAP_DIR):
+    os.makedirs(SPEECHMAP_DIR)
+
+# Ammissione in coda: budget massimo di lavoro arretrato, in secondi di elaborazione stimati
+QUEUE_BUDGET_SECONDS: Final[float] = float(os.environ.get("QUEUE_BUDGET_SECONDS", 4 * 3600))
+
+# Fattori real-time iniziali (secondi di elaborazione per secondo di audio), sostituiti dalle misure
+DEFAULT_REAL_TIME_FACTORS: Final[dict] = {
+    "cpu": {"tiny": 0.05, "base": 0.08, "small": 0.2, "medium": 0.5, "large-v3": 1.0},
+    "cuda": {"tiny": 0.01, "base": 0.015, "small": 0.03, "medium": 0.06, "large-v3": 0.1},
+}
+
+# Storico persistente dei fattori real-time misurati su questo host
+PERFORMANCE_HISTORY_PATH: Final[str] = os.path.join(STATE_DIR, "performance.json")
+PERFORMANCE_HISTORY_SAMPLES: Final[int] = 50
+
+# Aggiornamento automatico in background (0 = solo all'avvio)
+AUTO_UPDATE_INTERVAL: Final[float] = float(os.environ.get("AUTO_UPDATE_INTERVAL", 3600))
+# Attesa massima del job in corso prima di rimandare l'aggiornamento al controllo successivo
+UPDATE_DRAIN_TIMEOUT: Final[float] = float(os.environ.get("UPDATE_DRAIN_TIMEOUT", 4 * 3600))
+# Coda salvata durante l'aggiornamento e ripresa dalla nuova versione
+QUEUE_STATE_PATH: Final[str] = os.path.join(STATE_DIR, "queue.json")
+
+# Motore di trascrizione predefinito: "faster-whisper", "openai-whisper" oppure "stub" (segmenti sintetici deterministici, per i test di carico)
+TRANSCRIPTION_ENGINE: Final[str] = os.environ.get("TRANSCRIPTION_ENGINE", "faster-whisper")
+# Motore per modello, prevale sul predefinito (JSON, es. {"large-v3": "openai-whisper"}); il job può indicarne un altro
+MODEL_ENGINES: Final[dict] = json.loads(os.environ.get("MODEL_ENGINES", "{}"))
+# Tipo di calcolo dei pesi ("default", "int8", "float16", ...), se supportato dal motore
+COMPUTE_TYPE: Final[str] = os.environ.get("COMPUTE_TYPE", "default")
+# Dimensione del batch per i motori che lo supportano (0 = decodifica sequenziale)
+ENGINE_BATCH_SIZE: Final[int] = int(os.environ.get("ENGINE_BATCH_SIZE", 0))
+# Fattore real-time simulato dal motore stub (secondi di elaborazione per secondo di audio)
+STUB_REAL_TIME_FACTOR: Final[float] = float(os.environ.get("STUB_REAL_TIME_FACTOR", 0.05))
+
+# Consumatore dei segmenti (SegmentSink): capacità del buffer, intervallo di flush del file,
+# intervallo dei log di riepilogo e intervallo minimo tra due pubblicazioni del progresso
+SEGMENT_BUFFER_SIZE: Final[int] = 4096
+SEGMENT_FLUSH_INTERVAL: Final[float] = 2.0
+SEGMENT_LOG_INTERVAL: Final[float] = 10.0
+PROGRESS_UPDATE_INTERVAL: Final[float] = 0.5
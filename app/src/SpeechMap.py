@@ -0,0 +1,242 @@
+import bisect
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from Setting import *
+from AudioStream import AudioStream
+import TranscriptStorage
+
+
+_HASH_CHUNK_SIZE: Final[int] = 1024 * 1024
+
+
+def audio_hash(path: str) -> str:
+    """SHA-256 del contenuto del file audio."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@dataclass
+class SpeechMap:
+    """
+    Intervalli di parlato di un file audio, in secondi dall'inizio del file,
+    ordinati e disgiunti. Permette di limitare la decodifica alle parti con
+    parlato e di misurare il progresso sul parlato invece che sulla durata.
+    """
+    duration: float
+    segments: List[List[float]] = field(default_factory=list)
+    # parlato cumulativo alla fine di ciascun intervallo
+    _cumulative: List[float] = field(default_factory=list, init=False, repr=False)
+    _starts: List[float] = field(default_factory=list, init=False, repr=False)
+    _ends: List[float] = field(default_factory=list, init=False, repr=False)
+
+    def __post_init__(self):
+        self._starts = [start for start, _ in self.segments]
+        self._ends = [end for _, end in self.segments]
+        total = 0.0
+        for start, end in self.segments:
+            total += end - start
+            self._cumulative.append(total)
+
+    @property
+    def speech_seconds(self) -> float:
+        return self._cumulative[-1] if self._cumulative else 0.0
+
+    def speech_until(self, t: float) -> float:
+        """Secondi di parlato compresi tra l'inizio del file e t."""
+        i = bisect.bisect_right(self._starts, t) - 1
+        if i < 0:
+            return 0.0
+        start, end = self.segments[i]
+        before = self._cumulative[i - 1] if i > 0 else 0.0
+        return before + min(t, end) - start
+
+    def progress(self, t: float) -> float:
+        """Percentuale del parlato già elaborata quando la trascrizione è arrivata a t."""
+        if self.speech_seconds <= 0:
+            return 100.0
+        return self.speech_until(t) / self.speech_seconds * 100
+
+    def clips(self, offset: float, length: float) -> List[float]:
+        """
+        Intervalli di parlato della finestra [offset, offset + length) come lista
+        [inizio, fine, inizio, fine, ...] in secondi relativi all'inizio della
+        finestra. Lista vuota se la finestra è silenzio.
+        """
+        window_end = offset + length
+        clips: List[float] = []
+        i = bisect.bisect_right(self._ends, offset)
+        while i < len(self.segments) and self.segments[i][0] < window_end:
+            start, end = self.segments[i]
+            start, end = max(start, offset), min(end, window_end)
+            if end > start:
+                clips += [round(start - offset, 3), round(end - offset, 3)]
+            i += 1
+        return clips
+
+    def timeline(self, offset: float, length: float) -> Optional['SpeechTimeline']:
+        """Parlato della finestra da concatenare per la decodifica (None se la finestra è silenzio)."""
+        clips = self.clips(offset, length)
+        return SpeechTimeline(clips) if clips else None
+
+    def to_dict(self) -> dict:
+        return {"duration": self.duration, "segments": self.segments}
+
+    @staticmethod
+    def from_dict(data: dict) -> 'SpeechMap':
+        return SpeechMap(duration=data["duration"], segments=[list(s) for s in data["segments"]])
+
+
+class SpeechTimeline:
+    """
+    Intervalli di parlato di una finestra concatenati in un unico audio, come fa
+    il VAD interno di faster-whisper (collect_chunks): la decodifica procede a
+    finestre piene di 30 s di parlato invece che una per intervallo. original()
+    riporta i tempi dell'audio concatenato alla finestra, come SpeechTimestampsMap.
+    """
+
+    def __init__(self, clips: List[float]):
+        self._clip_starts: List[float] = []
+        self._clip_ends: List[float] = []
+        # inizio di ciascun intervallo nell'audio concatenato
+        self._chunk_starts: List[float] = []
+        position = 0.0
+        for start, end in zip(clips[0::2], clips[1::2]):
+            self._clip_starts.append(start)
+            self._clip_ends.append(end)
+            self._chunk_starts.append(position)
+            position += end - start
+        self.duration = position
+
+    def cut(self, audio: np.ndarray, sample_rate: int) -> np.ndarray:
+        """Audio dei soli intervalli di parlato, concatenati."""
+        return np.concatenate([
+            audio[int(start * sample_rate):int(end * sample_rate)]
+            for start, end in zip(self._clip_starts, self._clip_ends)
+        ])
+
+    def original(self, t: float, is_end: bool = False) -> float:
+        """Tempo nella finestra corrispondente al tempo t dell'audio concatenato."""
+        i = bisect.bisect_right(self._chunk_starts, t) - 1
+        # una fine che cade esattamente sul confine appartiene all'intervallo precedente
+        if is_end and i > 0 and t <= self._chunk_starts[i]:
+            i -= 1
+        i = max(0, i)
+        return self._clip_starts[i] + min(t - self._chunk_starts[i], self._clip_ends[i] - self._clip_starts[i])
+
+
+def compute_speech_map(path: str, vad_parameters: Optional[dict]) -> SpeechMap:
+    """Esegue il VAD sull'intero file, finestra per finestra, e ne costruisce la mappa del parlato."""
+    # il VAD (Silero) di faster-whisper serve solo qui: con altri motori il pacchetto resta opzionale
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    options = VadOptions(**(vad_parameters or {}))
+    segments: List[List[float]] = []
+    duration = 0.0
+
+    with AudioStream(path) as stream:
+        for offset, audio in stream.windows():
+            for timestamp in get_speech_timestamps(audio, options):
+                start = round(offset + timestamp["start"] / stream.sample_rate, 3)
+                end = round(offset + timestamp["end"] / stream.sample_rate, 3)
+                # il padding può far sovrapporre intervalli contigui a cavallo tra due finestre
+                if segments and start <= segments[-1][1]:
+                    segments[-1][1] = max(segments[-1][1], end)
+                else:
+                    segments.append([start, end])
+            duration = offset + len(audio) / stream.sample_rate
+            del audio
+
+    return SpeechMap(duration=round(duration, 3), segments=segments)
+
+
+class SpeechMapCache:
+    """
+    Mappe del parlato indicizzate per hash dell'audio e parametri VAD, salvate
+    in SPEECHMAP_DIR: lo stesso audio (ricaricato, ripreso dopo un riavvio o
+    usato da uno sweep) non viene analizzato due volte. Le richieste
+    concorrenti per la stessa chiave attendono il primo calcolo.
+    """
+
+    def __init__(self, directory: str = SPEECHMAP_DIR, memory_entries: int = SPEECHMAP_MEMORY_ENTRIES):
+        self._directory = directory
+        self._memory_entries = memory_entries
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, SpeechMap]" = OrderedDict()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        # percorso -> (dimensione, mtime_ns, hash), per non rileggere i file già visti
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}
+
+    def _hash_of(self, path: str) -> str:
+        stat = os.stat(path)
+        with self._lock:
+            cached = self._hashes.get(path)
+        if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[2]
+        digest = audio_hash(path)
+        with self._lock:
+            self._hashes[path] = (stat.st_size, stat.st_mtime_ns, digest)
+        return digest
+
+    @staticmethod
+    def key(digest: str, vad_parameters: Optional[dict]) -> str:
+        options = json.dumps(vad_parameters or {}, sort_keys=True)
+        return hashlib.sha256(f"{digest}:{options}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, speech_map: SpeechMap):
+        with self._lock:
+            self._memory[key] = speech_map
+            self._memory.move_to_end(key)
+            while len(self._memory) > self._memory_entries:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, key: str) -> Optional[SpeechMap]:
+        with self._lock:
+            speech_map = self._memory.get(key)
+            if speech_map is not None:
+                self._memory.move_to_end(key)
+                return speech_map
+
+        path = os.path.join(self._directory, key + ".json")
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                speech_map = SpeechMap.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Mappa del parlato non leggibile ({path}): {e}")
+            return None
+        self._remember(key, speech_map)
+        return speech_map
+
+    def get(self, path: str, vad_parameters: Optional[dict]) -> SpeechMap:
+        """Ritorna la mappa del parlato del file, calcolandola se non è in cache."""
+        key = self.key(self._hash_of(path), vad_parameters)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            speech_map = self._lookup(key)
+            if speech_map is None:
+                speech_map = compute_speech_map(path, vad_parameters)
+                try:
+                    TranscriptStorage.write_text_atomic(
+                        os.path.join(self._directory, key + ".json"), json.dumps(speech_map.to_dict())
+                    )
+                except Exception:
+                    logger.exception("Errore salvataggio mappa del parlato")
+                self._remember(key, speech_map)
+                logger.info(f"Mappa del parlato di {os.path.basename(path)}: "
+                            f"{speech_map.speech_seconds:.1f}s di parlato su {speech_map.duration:.1f}s")
+
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return speech_map
@@ -1,18 +1,21 @@
+import json
 import os
 import threading
 import time
-from typing import Callable, List, Optional
-from faster_whisper import WhisperModel
+from typing import Callable, Dict, List, Optional, Tuple
 import torch
 from datetime import datetime
-import librosa
-import whisper
 from Setting import *
+from AudioStream import AudioStream, probe_duration
+import TranscriptStorage
+from Engines import Engine, create_engine, engine_for
+from SpeechMap import SpeechMap, SpeechMapCache, SpeechTimeline
+from SegmentSink import SegmentSink
 from dataclasses import dataclass
 
 
 class Transcription:
-    def __init__(self, id, display_name, language, model, created_at, folder, temperature="?"):
+    def __init__(self, id, display_name, language, model, created_at, folder, temperature="?", suffix=None):
         self.id = id
         self.display_name = display_name
         self.language = language
@@ -20,7 +23,9 @@ class Transcription:
         self.temperature = temperature
         self.created_at = created_at
         self.folder = folder
-        self.status = "completed"  # completed, error, processing
+        self.status = "completed"  # completed, error, processing, draft
+        # suffisso di compressione (".gz", ".zst" o "" per testo semplice)
+        self.suffix = TranscriptStorage.active_suffix() if suffix is None else suffix
         self.file_path = self.generate_file_path()
 
     def __str__(self) -> str:
@@ -37,7 +42,8 @@ class Transcription:
             return transcriptions
         
         for file in files:
-            if file.endswith(".txt"):
+            suffix = TranscriptStorage.suffix_of(file)
+            if file.endswith(".txt" + suffix):
                 elements = [e.replace(']', '').replace('[', '') for e in file.split("]-[")]
                 elements[-1] = ''.join(elements[-1].split(".txt")[0:-1])
                 
@@ -54,14 +60,19 @@ class Transcription:
                         model=elements[3],
                         created_at=elements[1],
                         folder=folder,
-                        temperature=temperature
+                        temperature=temperature,
+                        suffix=suffix
                     )
                     transcriptions.append(transcription)
         return transcriptions
     
     def generate_file_path(self) -> str:
         safe_display_name = self.display_name.replace(']', '').replace('[', '')
-        return os.path.join(self.folder, f"[{self.id}]-[{self.created_at}]-[{self.language}]-[{self.model}]-[{safe_display_name}]-[{self.temperature}].txt")
+        return os.path.join(self.folder, f"[{self.id}]-[{self.created_at}]-[{self.language}]-[{self.model}]-[{safe_display_name}]-[{self.temperature}].txt{self.suffix}")
+    
+    def get_work_path(self) -> str:
+        """File di testo non compresso su cui scrivere durante l'elaborazione."""
+        return self.file_path + ".part"
     
     def get_download_name(self) -> str:
         safe_display_name = self.display_name.replace(']', '').replace('[', '')
@@ -81,6 +92,7 @@ class Transcription:
             'model': self.model,
             'created_at': self.created_at,
             'temperature': self.temperature,
+            'status': self.status,
             'file_path': self.folder
         }
 
@@ -100,6 +112,25 @@ class QueueItem:
     no_repeat_ngram_size: int = 0
     vad_parameters: Optional[dict] = None
     patience: Optional[float] = None
+    # False se il file appartiene all'utente (batch, cartelle monitorate) e non va cancellato
+    owns_file: bool = True
+    # copia del risultato da scrivere a fine elaborazione (albero di output delle cartelle monitorate)
+    output_path: Optional[str] = None
+    # modello veloce per una bozza immediata; il modello richiesto la sostituisce al termine
+    draft_model: Optional[str] = None
+    phase: Optional[str] = None  # draft, final
+    # sweep: una trascrizione per ciascuna configurazione di decodifica sullo stesso audio
+    sweep_configs: Optional[List[dict]] = None
+    # motore di trascrizione richiesto (None: quello configurato per il modello o il predefinito)
+    engine: Optional[str] = None
+    # durata dell'audio in secondi (misurata all'ammissione)
+    duration: Optional[float] = None
+    # secondi di parlato secondo la mappa del parlato (calcolata mentre l'elemento è in coda)
+    speech_seconds: Optional[float] = None
+    # scadenza richiesta (epoch in secondi) e scelta automatica del modello
+    deadline: Optional[float] = None
+    min_model: Optional[str] = None
+    auto_model: bool = False
     status: str = "pending"  # pending, processing, completed, error
     progress: int = 0
     created_at: Optional[str]  = None
@@ -109,6 +140,33 @@ class QueueItem:
             self.vad_parameters = {"min_silence_duration_ms": 1000}
         if self.created_at is None:
             self.created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if self.model_name == "auto":
+            self.auto_model = True
+        if self.draft_model == self.model_name or self.sweep_configs:
+            self.draft_model = None
+        if self.phase is None:
+            self.phase = "draft" if self.draft_model else "final"
+    
+    @property
+    def active_model(self) -> str:
+        """Modello da usare nella passata corrente."""
+        return self.draft_model if self.phase == "draft" and self.draft_model else self.model_name
+    
+    def remaining_passes(self) -> List[str]:
+        """Modelli delle passate ancora da eseguire (compresa quella corrente)."""
+        if self.phase == "draft" and self.draft_model:
+            return [self.draft_model, self.model_name]
+        return [self.model_name]
+    
+    @property
+    def work_seconds(self) -> Optional[float]:
+        """Audio da elaborare: il parlato se la mappa è già stata calcolata, altrimenti l'intera durata."""
+        return self.speech_seconds if self.speech_seconds is not None else self.duration
+    
+    @property
+    def is_refine(self) -> bool:
+        """Passata finale di un elemento che ha già prodotto la bozza."""
+        return self.phase == "final" and self.draft_model is not None
       
     # def __str__(self) -> str:
     #     #return f"QueueItem(id={self.id}, filename={self.filename}, language={self.language}, model={self.model_name}, status={self.status}, progress={self.progress}%), created_at={self.created_at}), filter={self.vad_filter}, beam_size={self.beam_size}), add_info={self.add_info})"
@@ -120,25 +178,52 @@ class QueueItem:
             'id': self.id,
             'filename': self.filename,
             'language': self.language,
-            'model': self.model_name,
+            'model': self.active_model,
+            'phase': self.phase,
             'status': self.status,
             'progress': self.progress,
+            'sweep': len(self.sweep_configs) if self.sweep_configs else 0,
+            'engine': engine_for(self.active_model, self.engine),
+            'duration': self.duration,
+            'speech_seconds': self.speech_seconds,
+            'deadline': self.deadline,
+            'auto_model': self.auto_model,
             'created_at': self.created_at
         }
 
 
+# parametri di decodifica che possono variare tra le configurazioni di uno sweep
+SWEEP_PARAMETERS: Dict[str, Callable] = {
+    'beam_size': int,
+    'temperature': float,
+    'best_of': int,
+    'compression_ratio_threshold': float,
+    'no_repeat_ngram_size': int,
+    'patience': float,
+}
+
+
 class Transcriber:
     def __init__(self, callback: Optional[Callable] = None, workers: int = 1, cpu_threads: int = 4):
         #self.model_name = model_name
         #self.model = whisper.load_model(model_name)
         self.__current_status: str = "idle"
         self.__current_file: str = ""
+        # secondi di audio (parlato, se la mappa è disponibile) decodificati nell'ultima esecuzione
+        # e tempo speso nella sola decodifica (escluso caricamento del modello, probe e VAD)
+        self._processed_seconds: float = 0.0
+        self._decode_seconds: float = 0.0
         self._lock = threading.Lock()
         self._callback: Optional[Callable] = callback
         self._stop_flag: bool = False
         self._current_device: Optional[str] = None
         self.__workers: int = workers
         self.__cpu_threads: int = cpu_threads
+        # ultimo modello caricato, riusato da job consecutivi con lo stesso modello (bozze, sweep)
+        self.__model = None
+        self.__model_key: Optional[tuple] = None
+        # mappe del parlato condivise tra pre-analisi in coda, trascrizione e sweep
+        self._speech_maps = SpeechMapCache()
         
         torch.set_float32_matmul_precision("high")
         self._device = "cuda" if torch.cuda.is_available() else "cpu"
@@ -155,6 +240,13 @@ class Transcriber:
         #with self._lock:
         self._stop_flag = True
     
+    def get_decode_measure(self) -> Tuple[float, float]:
+        """
+        (secondi di audio decodificati, secondi di decodifica) dell'ultima trascrizione
+        o sweep, per le misure del fattore real-time.
+        """
+        return self._processed_seconds, self._decode_seconds
+    
     def get_current_device(self) -> Optional[str]:
         """Restituisce il device su cui sta venendo eseguito il modello o None se non è in esecuzione."""
         
@@ -168,11 +260,104 @@ class Transcriber:
         seconds = int(seconds % 60)
         return f"{hours:02d}:{minutes:02d}:{seconds:02d}"    
     
+    def _load_model(self, model_name: str, engine: Optional[str] = None) -> Engine:
+        engine_name = engine_for(model_name, engine)
+        key = (engine_name, model_name, self._current_device)
+        if self.__model is not None and self.__model_key == key:
+            return self.__model
+        
+        # libera il modello precedente prima di caricare il nuovo
+        self.__model = None
+        self.__model_key = None
+        
+        logger.info(f"Caricamento modello {model_name} ({engine_name}, {self._current_device})")
+        model = create_engine(
+            engine_name,
+            model_name,
+            device=self._current_device,
+            cpu_threads=self.__cpu_threads,
+            workers=self.__workers
+        )
+        self.__model = model
+        self.__model_key = key
+        return model
+    
+    def prepare(self, item: QueueItem) -> Optional[SpeechMap]:
+        """
+        Calcola (o recupera dalla cache) la mappa del parlato dell'elemento e ne
+        aggiorna speech_seconds. Chiamato mentre l'elemento è in coda e di nuovo
+        all'avvio della trascrizione, quando la mappa è già in cache. Ritorna
+        None se il VAD è disattivato o l'analisi non riesce (si usa allora il VAD
+        interno alla decodifica, se il motore lo ha: vedi _check_vad).
+        """
+        if not item.vad_filter:
+            return None
+        try:
+            speech_map = self._speech_maps.get(item.file_path, item.vad_parameters)
+        except Exception as e:
+            logger.error(f"Mappa del parlato non disponibile per {item.filename}: {e}")
+            return None
+        item.speech_seconds = speech_map.speech_seconds
+        return speech_map
+    
+    @staticmethod
+    def _check_vad(item: QueueItem, model: Engine, speech_map: Optional[SpeechMap]):
+        """
+        Senza mappa del parlato il VAD è affidato al motore: se non lo supporta
+        (capabilities.vad) la trascrizione fallisce invece di decodificare anche
+        il silenzio ignorando vad_filter.
+        """
+        if item.vad_filter and speech_map is None and not model.capabilities.vad:
+            raise RuntimeError(
+                f"VAD richiesto ma mappa del parlato non disponibile e il motore {model.name} non ha VAD interno"
+            )
+    
+    @staticmethod
+    def _window_input(item: QueueItem, speech_map: Optional[SpeechMap], audio, offset: float, sample_rate: int):
+        """
+        Audio e argomenti VAD per la decodifica di una finestra. Con la mappa del parlato
+        si decodifica il solo parlato concatenato, senza rieseguire il VAD, e la
+        SpeechTimeline restituita riporta i tempi alla finestra. Ritorna None se la
+        finestra non contiene parlato.
+        """
+        if speech_map is None:
+            return audio, {'vad_filter': item.vad_filter, 'vad_parameters': item.vad_parameters}, None
+        timeline = speech_map.timeline(offset, len(audio) / sample_rate)
+        if timeline is None:
+            return None
+        return timeline.cut(audio, sample_rate), {'vad_filter': False}, timeline
+    
+    @staticmethod
+    def _segment_times(segment, offset: float, timeline: Optional[SpeechTimeline]):
+        """Inizio e fine del segmento in secondi dall'inizio del file."""
+        if timeline is None:
+            return offset + segment.start, offset + segment.end
+        return offset + timeline.original(segment.start), offset + timeline.original(segment.end, is_end=True)
+    
+    @staticmethod
+    def _window_work(speech_map: Optional[SpeechMap], offset: float, length: float) -> float:
+        """Secondi di audio da decodificare nella finestra: il parlato se la mappa è disponibile."""
+        if speech_map is None:
+            return length
+        return speech_map.speech_until(offset + length) - speech_map.speech_until(offset)
+    
+    def __format_line(self, item: QueueItem, start: float, end: float, progress_percent: float, text: str) -> str:
+        if item.add_info:
+            # Formatta l'output con timestamp in formato HH:MM:SS
+            segmentrange = f"[{self.__format_time(start)} -> {self.__format_time(end)}]"
+            progress_info = f"[Progress: {progress_percent:.3f}%]"
+            data = f"{segmentrange} {progress_info} "
+            fixed_data = f"{data:<45}"
+            return f"{fixed_data}: {text}\n"
+        return text + "\n"
+    
     def transcribe(self, queueLock, item: QueueItem, updateFunc: Callable) -> Transcription:
         
         # Resetta il flag di stop all'inizio della trascrizione
         with self._lock:
             self._stop_flag = False
+            self._processed_seconds = 0.0
+            self._decode_seconds = 0.0
             self._current_device = "cuda" if torch.cuda.is_available() else "cpu"
             self.__current_file = item.filename
         
@@ -180,17 +365,18 @@ class Transcriber:
                 id=item.id,
                 display_name=item.filename,
                 language=item.language,
-                model=item.model_name,
+                model=item.active_model,
                 created_at=item.created_at,
                 folder=TRANSCRIPTIONS_DIR,
                 temperature=str(item.temperature)
             ) 
             
         transcription.status = "processing"
-        total_duration = librosa.get_duration(path=item.file_path)
+        total_duration = probe_duration(item.file_path)
         logger.info(f"Audio duration: {self.__format_time(total_duration)}") 
         logger.info(f"Current transcription: {transcription}")
-        output_path = transcription.file_path
+        # si scrive su un file di lavoro non compresso, reso definitivo (ed eventualmente compresso) alla fine
+        output_path = transcription.get_work_path()
         
         try: 
             with open(output_path, "w", encoding="utf-8") as f:
@@ -217,102 +403,17 @@ class Transcriber:
                 self.__current_status = "processing"
                 
             
-            #https://developer.nvidia.com/rdp/cudnn-archive
-            model = WhisperModel(
-                model_size_or_path=item.model_name,
-                device=self._current_device,
-                device_index=0,
-                #compute_type="float16" if torch.cuda.is_available() else "default",
-                cpu_threads=self.__cpu_threads,
-                num_workers=self.__workers
-            )
+            speech_map = self.prepare(item)
+            if speech_map is not None and not speech_map.segments:
+                # nessun parlato: la trascrizione resta vuota e il modello non viene caricato
+                logger.info(f"[{item.filename}] Nessun parlato rilevato.")
+                item.progress = 100
+            else:
+                self._decode(item, transcription, output_path, total_duration, speech_map, updateFunc)
             
-            segments, info = model.transcribe(
-                item.file_path,
-                language=item.language if item.language and item.language != "auto" else None,
-                task="transcribe",
-                beam_size=item.beam_size,
-                vad_filter=item.vad_filter,
-                vad_parameters=item.vad_parameters,
-                temperature=[item.temperature],
-                # best_of=item.best_of,
-                compression_ratio_threshold=item.compression_ratio_threshold,
-                no_repeat_ngram_size=item.no_repeat_ngram_size,
-                # patience=item.patience if item.patience is not None else 1,
-            )
-            #print(f"Detected language '{info.language}' with probability {info.language_probability:.2f}")
-
-            last_int_progress_percent = -1
-            last_update_time = time.time()
-            dt = 0.5  # intervallo minimo tra gli aggiornamenti in secondi
-            
-            with open(output_path, "a", encoding="utf-8") as f:
-                for segment in segments:
-                    
-                    # check stop
-                    if self._stop_flag:
-                        with self._lock:
-                            logger.info("Transcriber stopped!")
-                            self.__current_status = "stopped"
-                            transcription.status = "stopped"
-                            break
-                   
-                        
-                    
-                    #Calcola la percentuale di completamento in base alla durata totale
-                    progress_percent = (segment.end / total_duration) * 100 if total_duration > 0 else 0
-                    int_progress_percent = min(100, int(progress_percent))
-                    
-                    logger.info(f"[{item.filename}] Segment {segment.start:.2f}s to {segment.end:.2f}s: {segment.text} (Progress: {progress_percent:.3f}%)")
-                    
-                    # if int_progress_percent > last_int_progress_percent:
-                    #     if time.time() - last_update_time >= dt: 
-                    #         last_update_time = time.time()
-                            
-                    #         with self._lock:
-                    #             last_int_progress_percent = int_progress_percent
-                    #             item.progress = int_progress_percent
-                    #             if updateFunc:
-                    #                 updateFunc()
-                    
-                    # if item.add_info:
-                    #     # Formatta l'output con timestamp in formato HH:MM:SS
-                    #     segmentrange = f"[{self.__format_time(segment.start)} -> {self.__format_time(segment.end)}]"
-                    #     progress_info = f"[Progress: {progress_percent:.3f}%]"
-                    #     data = f"{segmentrange} {progress_info} "
-                    #     fixed_data = f"{data:<45}"
-                    #     text = f"{fixed_data}: {segment.text}"
-                    #     f.write(text + "\n")
-                    # else:
-                    #     f.write(segment.text + "\n")
-
-                    # aggiorna progress brevemente sotto lock, ma CALLBACK fuori dal lock
-                    call_update = False
-                    with self._lock:
-                        if int_progress_percent > last_int_progress_percent and (time.time() - last_update_time >= dt):
-                            last_int_progress_percent = int_progress_percent
-                            item.progress = int_progress_percent
-                            last_update_time = time.time()
-                            call_update = True
-
-                    if call_update and updateFunc:
-                        try:
-                            updateFunc()   # chiamata fuori dal lock
-                        except Exception:
-                            logger.exception("updateFunc raised an exception")
-
-                    # scrivi testo (IO) — non serve lock
-                    if item.add_info:
-                        segmentrange = f"[{self.__format_time(segment.start)} -> {self.__format_time(segment.end)}]"
-                        progress_info = f"[Progress: {progress_percent:.3f}%]"
-                        data = f"{segmentrange} {progress_info} "
-                        fixed_data = f"{data:<45}"
-                        text = f"{fixed_data}: {segment.text}"
-                        f.write(text + "\n")
-                    else:
-                        f.write(segment.text + "\n")
-                    
-                self.__current_status = "completed"
+            if transcription.status == "stopped":
+                # il file contiene solo la parte trascritta prima dello stop
+                return transcription
             
             with self._lock:
                 self.__current_status = "completed"
@@ -335,6 +436,12 @@ class Transcriber:
                 except Exception:
                     logger.exception("updateFunc raised unhandled exception in error path")
         finally:
+            if os.path.exists(output_path):
+                try:
+                    TranscriptStorage.finalize(output_path, transcription.file_path)
+                except Exception:
+                    logger.exception("Errore salvataggio trascrizione")
+            
             # pulizia stato in ogni caso
             with self._lock:
                 self.__current_file = ""
@@ -347,4 +454,324 @@ class Transcriber:
                 except Exception:
                     logger.exception("updateFunc raised an exception")
 
-            return transcription
\ No newline at end of file
+            return transcription
+    def _decode(
+        self,
+        item: QueueItem,
+        transcription: Transcription,
+        output_path: str,
+        total_duration: float,
+        speech_map: Optional[SpeechMap],
+        updateFunc: Callable
+    ):
+        """Decodifica l'audio finestra per finestra accodando i segmenti al file di lavoro."""
+        model = self._load_model(item.active_model, item.engine)
+        self._check_vad(item, model, speech_map)
+        
+        language = item.language if item.language and item.language != "auto" else None
+
+        def publish_progress(percent: int):
+            item.progress = percent
+            if updateFunc:
+                updateFunc()
+        
+        # scrittura su file, log e pubblicazione del progresso avvengono nel thread
+        # del SegmentSink: il ciclo di decodifica si limita ad accodare i segmenti
+        sink = SegmentSink(
+            output_path,
+            label=item.filename,
+            formatter=lambda start, end, progress, text: self.__format_line(item, start, end, progress, text),
+            on_progress=publish_progress
+        )
+        
+        # L'audio viene decodificato a finestre tramite ffmpeg: la memoria
+        # occupata non dipende dalla durata del file.
+        try:
+            with AudioStream(item.file_path) as stream:
+                for offset, audio in stream.windows():
+
+                    # stop arrivato tra una finestra e l'altra (dopo l'ultimo segmento o in una finestra senza parlato)
+                    if self._stop_flag:
+                        with self._lock:
+                            logger.info("Transcriber stopped!")
+                            self.__current_status = "stopped"
+                            transcription.status = "stopped"
+                        break
+
+                    window_duration = len(audio) / stream.sample_rate
+                    window = self._window_input(item, speech_map, audio, offset, stream.sample_rate)
+                    if window is None:
+                        # finestra senza parlato: nessuna decodifica
+                        del audio
+                        continue
+                    speech_audio, vad_arguments, timeline = window
+                    
+                    started = time.time()
+                    segments, info = model.transcribe(
+                        speech_audio,
+                        language=language,
+                        beam_size=item.beam_size,
+                        **vad_arguments,
+                        temperature=item.temperature,
+                        # best_of=item.best_of,
+                        compression_ratio_threshold=item.compression_ratio_threshold,
+                        no_repeat_ngram_size=item.no_repeat_ngram_size,
+                        # patience=item.patience if item.patience is not None else 1,
+                    )
+                    #print(f"Detected language '{info.language}' with probability {info.language_probability:.2f}")
+                    
+                    for segment in segments:
+                        
+                        # check stop (lettura di un bool: non serve lock)
+                        if self._stop_flag:
+                            with self._lock:
+                                logger.info("Transcriber stopped!")
+                                self.__current_status = "stopped"
+                                transcription.status = "stopped"
+                                break
+                        
+                        # la lingua rilevata sulla prima finestra con parlato vale per tutto il file
+                        if language is None:
+                            language = info.language
+                        
+                        # timestamp relativi all'inizio del file; il progresso è misurato sul parlato se la mappa è disponibile
+                        start, end = self._segment_times(segment, offset, timeline)
+                        if speech_map is not None:
+                            progress_percent = speech_map.progress(end)
+                        else:
+                            progress_percent = (end / total_duration) * 100 if total_duration > 0 else 0
+                        sink.put(start, end, progress_percent, segment.text)
+                    
+                    if not self._stop_flag:
+                        self._processed_seconds += self._window_work(speech_map, offset, window_duration)
+                        self._decode_seconds += time.time() - started
+                    
+                    # rilascia la finestra prima di decodificare la successiva
+                    del audio, speech_audio, segments
+        finally:
+            # svuota il buffer e chiude il file; un errore di scrittura fa fallire la trascrizione
+            sink.close()
+
+    def transcribe_sweep(self, queueLock, item: QueueItem, updateFunc: Callable) -> List[Transcription]:
+        """
+        Esegue tutte le configurazioni di item.sweep_configs sullo stesso audio:
+        il file viene decodificato una sola volta (finestra per finestra) e il
+        modello caricato una sola volta. Per ogni finestra l'encoder viene eseguito
+        una volta (model.encode) e per ciascuna configurazione solo il decoder
+        (model.decode), se il motore ha shared_encoding; altrimenti ogni
+        configurazione ripete la trascrizione della finestra. Produce una
+        trascrizione per configurazione e un riepilogo comparativo salvato in
+        STATE_DIR/sweeps.
+        """
+        configs = item.sweep_configs or []
+        
+        with self._lock:
+            self._stop_flag = False
+            self._processed_seconds = 0.0
+            self._decode_seconds = 0.0
+            self._current_device = "cuda" if torch.cuda.is_available() else "cpu"
+            self.__current_file = item.filename
+            self.__current_status = "processing"
+        
+        transcriptions: List[Transcription] = []
+        stats: List[dict] = []
+        for k, config in enumerate(configs):
+            transcription = Transcription(
+                id=f"{item.id}-{k + 1}",
+                display_name=f"{item.filename} #{k + 1}",
+                language=item.language,
+                model=item.model_name,
+                created_at=item.created_at,
+                folder=TRANSCRIPTIONS_DIR,
+                temperature=str(config.get('temperature', item.temperature))
+            )
+            transcription.status = "processing"
+            transcriptions.append(transcription)
+            stats.append({'segments': 0, 'words': 0, 'characters': 0, 'decode_seconds': 0.0,
+                          'avg_logprob': 0.0, 'compression_ratio': 0.0, 'no_speech_prob': 0.0})
+        
+        work_paths = [t.get_work_path() for t in transcriptions]
+        sinks: List[SegmentSink] = []
+        status = "completed"
+        total_duration = 0.0
+        # tempo dell'encoder condiviso tra le configurazioni (None se il motore non lo condivide)
+        encode_seconds: Optional[float] = None
+        
+        try:
+            total_duration = probe_duration(item.file_path)
+            logger.info(f"Sweep di {len(configs)} configurazioni su {item.filename} ({self.__format_time(total_duration)})")
+            
+            for k, path in enumerate(work_paths):
+                open(path, "w", encoding="utf-8").close()
+                # il progresso dello sweep è pubblicato per finestra, qui serve solo la scrittura
+                sinks.append(SegmentSink(
+                    path,
+                    label=f"{item.filename} #{k + 1}",
+                    formatter=lambda start, end, progress, text: self.__format_line(item, start, end, progress, text)
+                ))
+            
+            speech_map = self.prepare(item)
+            if speech_map is not None and not speech_map.segments:
+                # nessun parlato: trascrizioni vuote senza caricare il modello
+                logger.info(f"[{item.filename}] Nessun parlato rilevato.")
+                item.progress = 100
+            else:
+                model = self._load_model(item.model_name, item.engine)
+                self._check_vad(item, model, speech_map)
+                language = item.language if item.language and item.language != "auto" else None
+                
+                with AudioStream(item.file_path) as stream:
+                    for offset, audio in stream.windows():
+                        window_duration = len(audio) / stream.sample_rate
+                        # la mappa del parlato è calcolata una volta e vale per tutte le configurazioni
+                        window = self._window_input(item, speech_map, audio, offset, stream.sample_rate)
+                        if window is None:
+                            del audio
+                            continue
+                        speech_audio, vad_arguments, timeline = window
+                        
+                        # encoder una sola volta per finestra, condiviso da tutte le configurazioni
+                        started = time.time()
+                        encoded = model.encode(speech_audio, language=language, **vad_arguments)
+                        if model.capabilities.shared_encoding:
+                            encode_seconds = (encode_seconds or 0.0) + time.time() - started
+                        if language is None:
+                            language = encoded.language
+                        
+                        for k, config in enumerate(configs):
+                            if self._stop_flag:
+                                break
+                            
+                            params = {name: config.get(name, getattr(item, name)) for name in SWEEP_PARAMETERS}
+                            started = time.time()
+                            segments, info = model.decode(
+                                encoded,
+                                beam_size=params['beam_size'],
+                                temperature=params['temperature'],
+                                compression_ratio_threshold=params['compression_ratio_threshold'],
+                                no_repeat_ngram_size=params['no_repeat_ngram_size'],
+                                best_of=params['best_of'],
+                                patience=params['patience'] if params['patience'] is not None else 1.0,
+                            )
+                            
+                            # progresso: finestre completate + configurazioni completate nella finestra corrente
+                            if speech_map is not None:
+                                done = speech_map.speech_until(offset)
+                                window_speech = speech_map.speech_until(offset + window_duration) - done
+                                progress_percent = (done + window_speech * (k + 1) / len(configs)) / speech_map.speech_seconds * 100
+                            else:
+                                progress_percent = (offset + window_duration * (k + 1) / len(configs)) / total_duration * 100 if total_duration > 0 else 0
+                            
+                            for segment in segments:
+                                if self._stop_flag:
+                                    break
+                                start, end = self._segment_times(segment, offset, timeline)
+                                sinks[k].put(start, end, progress_percent, segment.text)
+                                
+                                entry = stats[k]
+                                entry['segments'] += 1
+                                entry['words'] += len(segment.text.split())
+                                entry['characters'] += len(segment.text.strip())
+                                entry['avg_logprob'] += segment.avg_logprob
+                                entry['compression_ratio'] += segment.compression_ratio
+                                entry['no_speech_prob'] += segment.no_speech_prob
+                            
+                            decode_seconds = time.time() - started
+                            stats[k]['decode_seconds'] += decode_seconds
+                            if not self._stop_flag:
+                                self._processed_seconds += self._window_work(speech_map, offset, window_duration)
+                                self._decode_seconds += decode_seconds
+                            
+                            if language is None:
+                                language = info.language
+                            
+                            item.progress = min(100, int(progress_percent))
+                            if updateFunc:
+                                try:
+                                    updateFunc()
+                                except Exception:
+                                    logger.exception("updateFunc raised an exception")
+                        
+                        del audio, speech_audio, encoded
+                        if self._stop_flag:
+                            logger.info("Transcriber stopped!")
+                            status = "stopped"
+                            break
+            
+        except Exception as e:
+            logger.error(f"Error during sweep: {e}")
+            status = "error"
+        finally:
+            for sink in sinks:
+                try:
+                    sink.close()
+                except Exception as e:
+                    logger.error(f"Error writing sweep transcription: {e}")
+                    status = "error"
+            for transcription, path in zip(transcriptions, work_paths):
+                transcription.status = status
+                if os.path.exists(path):
+                    try:
+                        TranscriptStorage.finalize(path, transcription.file_path)
+                    except Exception:
+                        logger.exception("Errore salvataggio trascrizione")
+            
+            with self._lock:
+                self.__current_file = ""
+                self.__current_status = status
+        
+        self._write_sweep_summary(item, transcriptions, stats, total_duration, status, encode_seconds)
+        
+        if status == "completed" and self._callback is not None:
+            try:
+                self._callback()
+            except Exception:
+                logger.exception("callback raised an exception")
+        
+        if updateFunc:
+            try:
+                updateFunc()
+            except Exception:
+                logger.exception("updateFunc raised an exception")
+        
+        return transcriptions
+    
+    def _write_sweep_summary(self, item: QueueItem, transcriptions: List[Transcription], stats: List[dict], total_duration: float,
+                             status: str, encode_seconds: Optional[float] = None):
+        results = []
+        for config, transcription, entry in zip(item.sweep_configs or [], transcriptions, stats):
+            segments = max(1, entry['segments'])
+            results.append({
+                'transcription_id': transcription.id,
+                'config': config,
+                'segments': entry['segments'],
+                'words': entry['words'],
+                'characters': entry['characters'],
+                'decode_seconds': round(entry['decode_seconds'], 3),
+                'real_time_factor': round(entry['decode_seconds'] / total_duration, 4) if total_duration > 0 else None,
+                'mean_avg_logprob': round(entry['avg_logprob'] / segments, 4),
+                'mean_compression_ratio': round(entry['compression_ratio'] / segments, 4),
+                'mean_no_speech_prob': round(entry['no_speech_prob'] / segments, 4),
+            })
+        
+        summary = {
+            'id': item.id,
+            'filename': item.filename,
+            'model': item.model_name,
+            'duration': total_duration,
+            'status': status,
+            'created_at': item.created_at,
+            # encoder eseguito una volta per finestra e condiviso (escluso da decode_seconds delle configurazioni)
+            'shared_encoding': encode_seconds is not None,
+            'encode_seconds': round(encode_seconds, 3) if encode_seconds is not None else None,
+            'results': results,
+        }
+        
+        try:
+            TranscriptStorage.write_text_atomic(sweep_summary_path(item.id), json.dumps(summary, indent=2))
+        except Exception:
+            logger.exception("Errore salvataggio riepilogo sweep")
+
+
+def sweep_summary_path(item_id: str) -> str:
+    return os.path.join(SWEEP_DIR, f"{os.path.basename(item_id)}.json")
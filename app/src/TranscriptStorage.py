@@ -0,0 +1,134 @@
+import gzip
+import io
+import os
+import shutil
+import tempfile
+from typing import IO, Optional
+from Setting import *
+
+try:
+    import zstandard
+except ImportError:  # dipendenza opzionale
+    zstandard = None
+
+
+# suffisso del file -> Content-Encoding HTTP equivalente
+CONTENT_ENCODINGS: Final[dict] = {
+    ".gz": "gzip",
+    ".zst": "zstd",
+}
+
+CODEC_SUFFIXES: Final[dict] = {
+    "none": "",
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+
+_CHUNK_SIZE: Final[int] = 64 * 1024
+
+
+def active_suffix() -> str:
+    """Suffisso da usare per le nuove trascrizioni in base a TRANSCRIPT_COMPRESSION."""
+    codec = TRANSCRIPT_COMPRESSION.lower()
+    if codec not in CODEC_SUFFIXES:
+        logger.warning(f"Compressione '{codec}' non supportata, uso file non compressi.")
+        return ""
+    if codec == "zstd" and zstandard is None:
+        logger.warning("Modulo 'zstandard' non installato, uso gzip.")
+        return CODEC_SUFFIXES["gzip"]
+    return CODEC_SUFFIXES[codec]
+
+
+def suffix_of(path: str) -> str:
+    """Suffisso di compressione del file ("" se non compresso)."""
+    for suffix in CONTENT_ENCODINGS:
+        if path.endswith(suffix):
+            return suffix
+    return ""
+
+
+def content_encoding_of(path: str) -> Optional[str]:
+    return CONTENT_ENCODINGS.get(suffix_of(path))
+
+
+def open_binary(path: str) -> IO[bytes]:
+    """Apre il file decomprimendolo in streaming."""
+    suffix = suffix_of(path)
+    if suffix == ".gz":
+        return gzip.open(path, "rb")
+    if suffix == ".zst":
+        if zstandard is None:
+            raise RuntimeError("Modulo 'zstandard' non installato: impossibile leggere " + path)
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    return open(path, "rb")
+
+
+def open_text(path: str) -> IO[str]:
+    return io.TextIOWrapper(open_binary(path), encoding="utf-8")
+
+
+def _compress_to(src, dst, suffix: str):
+    if suffix == ".gz":
+        with gzip.GzipFile(fileobj=dst, mode="wb", compresslevel=6) as out:
+            shutil.copyfileobj(src, out, _CHUNK_SIZE)
+    elif suffix == ".zst":
+        compressor = zstandard.ZstdCompressor(level=10)
+        compressor.copy_stream(src, dst, read_size=_CHUNK_SIZE, write_size=_CHUNK_SIZE)
+    else:
+        shutil.copyfileobj(src, dst, _CHUNK_SIZE)
+
+
+def finalize(work_path: str, final_path: str):
+    """
+    Sposta il file di lavoro (testo non compresso) nella posizione definitiva,
+    comprimendolo se richiesto dal suffisso. La scrittura avviene su un file
+    temporaneo nella stessa cartella seguito da rename atomico.
+    """
+    suffix = suffix_of(final_path)
+    if not suffix:
+        os.replace(work_path, final_path)
+        return
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(final_path), suffix=".tmp")
+    try:
+        with open(work_path, "rb") as src, os.fdopen(fd, "wb") as dst:
+            _compress_to(src, dst, suffix)
+        os.replace(tmp_path, final_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    os.remove(work_path)
+
+
+def write_text_atomic(path: str, text: str):
+    """Scrive un testo (compresso secondo il suffisso di path) con write-then-rename."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as dst:
+            _compress_to(io.BytesIO(text.encode("utf-8")), dst, suffix_of(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def export_plain(path: str, destination: str):
+    """Copia la trascrizione (decompressa) in destination, creando le cartelle mancanti."""
+    os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(destination) or ".", suffix=".tmp")
+    try:
+        with open_binary(path) as src, os.fdopen(fd, "wb") as dst:
+            shutil.copyfileobj(src, dst, _CHUNK_SIZE)
+        os.replace(tmp_path, destination)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
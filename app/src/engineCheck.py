@@ -0,0 +1,160 @@
+"""
+Verifica di conformità e velocità dei motori di trascrizione.
+
+    python engineCheck.py --engines stub faster-whisper openai-whisper --model tiny --audio esempio.mp3
+
+Ogni motore disponibile viene caricato e usato sullo stesso audio (i primi
+--seconds secondi di --audio, oppure un segnale sintetico deterministico) con
+gli stessi parametri. Per ciascuno si verifica che rispetti l'interfaccia di
+Engine.transcribe:
+
+- ritorna (segmenti, info) e info.language è valorizzato dopo la decodifica;
+- i segmenti hanno start/end/text/avg_logprob/compression_ratio/no_speech_prob,
+  start <= end, tempi entro la finestra e inizi non decrescenti;
+- con clip_timestamps i segmenti cadono dentro gli intervalli richiesti;
+- encode() seguito da più decode() (sweep) produce segmenti validi; il report
+  riporta il tempo dell'encoder e di ciascun decode();
+- due esecuzioni identiche producono lo stesso testo (obbligatorio solo per lo stub).
+
+Il report (JSON) riporta tempo di caricamento e fattore real-time di ogni
+motore; il codice di uscita è 1 se almeno un motore non è conforme.
+"""
+import argparse
+import json
+import math
+import sys
+import time
+from dataclasses import asdict
+from typing import List, Optional
+import numpy as np
+from Setting import *
+from Engines import ENGINES, create_engine
+
+
+SEGMENT_FIELDS = ("start", "end", "text", "avg_logprob", "compression_ratio", "no_speech_prob")
+# tolleranza sui tempi dei segmenti (arrotondamenti ai token temporali di Whisper)
+TOLERANCE_SECONDS = 0.5
+
+
+def synthetic_audio(seconds: float, seed: int = 1234) -> np.ndarray:
+    """Tono con rumore e pause (3 s di segnale, 1 s di silenzio), sempre uguale a parità di seed."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    active = (t % 4.0) < 3.0
+    signal = np.where(active, 0.3 * np.sin(2 * math.pi * 220 * t), 0.0)
+    return (signal + rng.uniform(-0.01, 0.01, len(t))).astype(np.float32)
+
+
+def load_audio(path: Optional[str], seconds: float) -> np.ndarray:
+    if path is None:
+        return synthetic_audio(seconds)
+    from AudioStream import AudioStream
+    with AudioStream(path, window_seconds=seconds) as stream:
+        for _, audio in stream.windows():
+            return audio
+    raise RuntimeError(f"Nessun audio letto da {path}")
+
+
+def run(engine, audio: np.ndarray, clips: Optional[List[float]] = None):
+    started = time.perf_counter()
+    segments, info = engine.transcribe(audio, language=None, beam_size=5, temperature=0.0,
+                                       vad_filter=False, clip_timestamps=clips)
+    segments = list(segments)
+    return segments, info, time.perf_counter() - started
+
+
+def check_segments(segments, duration: float, clips: Optional[List[float]] = None) -> List[str]:
+    errors = []
+    previous = -1.0
+    ranges = list(zip(clips[0::2], clips[1::2])) if clips else [(0.0, duration)]
+    for n, segment in enumerate(segments):
+        missing = [name for name in SEGMENT_FIELDS if not hasattr(segment, name)]
+        if missing:
+            errors.append(f"segmento {n}: campi mancanti {missing}")
+            continue
+        if segment.start > segment.end:
+            errors.append(f"segmento {n}: start {segment.start:.2f} > end {segment.end:.2f}")
+        if segment.start < previous - TOLERANCE_SECONDS:
+            errors.append(f"segmento {n}: inizio {segment.start:.2f} precedente al segmento prima")
+        if not any(start - TOLERANCE_SECONDS <= segment.start and segment.end <= end + TOLERANCE_SECONDS
+                   for start, end in ranges):
+            errors.append(f"segmento {n}: [{segment.start:.2f}, {segment.end:.2f}] fuori dagli intervalli {ranges}")
+        previous = segment.start
+    return errors
+
+
+def check_engine(name: str, model: str, audio: np.ndarray, device: str) -> dict:
+    duration = len(audio) / SAMPLE_RATE
+    report = {"engine": name, "capabilities": None, "errors": []}
+    engine_class = ENGINES[name]
+    report["capabilities"] = asdict(engine_class.capabilities)
+    if not engine_class.available():
+        report["skipped"] = f"modulo '{engine_class.module}' non installato"
+        return report
+
+    started = time.perf_counter()
+    engine = create_engine(name, model, device=device)
+    report["load_seconds"] = round(time.perf_counter() - started, 3)
+
+    segments, info, elapsed = run(engine, audio)
+    report["errors"] += check_segments(segments, duration)
+    if not getattr(info, "language", None):
+        report["errors"].append("info.language non valorizzato")
+    report["segments"] = len(segments)
+    report["real_time_factor"] = round(elapsed / duration, 4)
+
+    # due intervalli separati da una pausa, relativi all'inizio della finestra
+    clips = [round(duration * 0.1, 2), round(duration * 0.4, 2), round(duration * 0.6, 2), round(duration * 0.9, 2)]
+    clipped, _, clipped_elapsed = run(engine, audio, clips)
+    report["errors"] += [f"clip_timestamps: {e}" for e in check_segments(clipped, duration, clips)]
+    report["clipped_real_time_factor"] = round(clipped_elapsed / duration, 4)
+
+    # sweep: encoder una volta, decoder per due configurazioni
+    started = time.perf_counter()
+    encoded = engine.encode(audio, language=info.language)
+    report["encode_seconds"] = round(time.perf_counter() - started, 3)
+    decode_seconds = []
+    for beam_size in (1, 5):
+        started = time.perf_counter()
+        decoded, _ = engine.decode(encoded, beam_size=beam_size)
+        decoded = list(decoded)
+        decode_seconds.append(round(time.perf_counter() - started, 3))
+        report["errors"] += [f"decode (beam_size={beam_size}): {e}" for e in check_segments(decoded, duration)]
+    report["decode_seconds"] = decode_seconds
+
+    repeated, _, _ = run(engine, audio)
+    deterministic = [s.text for s in repeated] == [s.text for s in segments]
+    report["deterministic"] = deterministic
+    if name == "stub" and not deterministic:
+        report["errors"].append("il motore stub deve essere deterministico")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conformità e velocità dei motori di trascrizione")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=list(ENGINES))
+    parser.add_argument("--model", default="tiny")
+    parser.add_argument("--audio", default=None, help="file audio da usare (default: segnale sintetico)")
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--output", default=None, help="file JSON del report")
+    args = parser.parse_args()
+
+    audio = load_audio(args.audio, args.seconds)
+    reports = []
+    for name in args.engines:
+        try:
+            reports.append(check_engine(name, args.model, audio, args.device))
+        except Exception as e:
+            reports.append({"engine": name, "errors": [f"{type(e).__name__}: {e}"]})
+
+    text = json.dumps({"model": args.model, "audio_seconds": round(len(audio) / SAMPLE_RATE, 2), "engines": reports}, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    sys.exit(1 if any(r["errors"] for r in reports) else 0)
+
+
+if __name__ == "__main__":
+    main()
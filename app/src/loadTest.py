@@ -0,0 +1,287 @@
+"""
+Generatore di carico per il web server.
+
+Avviare il server con il motore stub (nessun modello reale):
+
+    TRANSCRIPTION_ENGINE=stub STUB_REAL_TIME_FACTOR=0.02 python main.py
+
+e in un altro terminale:
+
+    python loadTest.py --uploads 40 --concurrency 8 --socket-clients 50 --output report.json
+
+Il generatore crea file WAV sintetici deterministici (stesso --seed, stessi
+file), li carica in parallelo su /transcribe, mantiene --socket-clients client
+Socket.IO iscritti a queue_status / transcriptions_update e genera traffico di
+lettura (elenco e download delle trascrizioni) finché tutti i job caricati non
+sono completati. Il report riporta i percentili di latenza per endpoint e il
+costo della diffusione degli eventi (eventi ricevuti e ritardo di consegna).
+"""
+import argparse
+import json
+import math
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+
+def percentiles(values: List[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(math.ceil(p / 100 * len(ordered))) - 1)]
+
+    return {
+        "count": len(ordered),
+        "p50": round(pick(50) * 1000, 2),
+        "p90": round(pick(90) * 1000, 2),
+        "p99": round(pick(99) * 1000, 2),
+        "max": round(ordered[-1] * 1000, 2),
+    }
+
+
+def generate_wav(path: str, seconds: float, rng: random.Random, sample_rate: int = 16000):
+    """Tono con rumore e pause: abbastanza realistico per decodifica e VAD, sempre uguale a parità di seed."""
+    frequency = rng.uniform(120, 400)
+    frames = bytearray()
+    for n in range(int(seconds * sample_rate)):
+        t = n / sample_rate
+        # alterna circa 3 s di "parlato" e 1 s di silenzio
+        active = (t % 4.0) < 3.0
+        value = (0.3 * math.sin(2 * math.pi * frequency * t) + rng.uniform(-0.05, 0.05)) if active else rng.uniform(-0.005, 0.005)
+        frames += struct.pack("<h", int(max(-1.0, min(1.0, value)) * 32767))
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(bytes(frames))
+
+
+def encode_multipart(fields: Dict[str, str], files: List[Tuple[str, str, bytes]]) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    body = bytearray()
+    for name, value in fields.items():
+        body += f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n".encode()
+    for name, filename, data in files:
+        body += (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"; filename=\"{filename}\"\r\n"
+                 f"Content-Type: audio/wav\r\n\r\n").encode()
+        body += data + b"\r\n"
+    body += f"--{boundary}--\r\n".encode()
+    return bytes(body), f"multipart/form-data; boundary={boundary}"
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.base_url = args.url.rstrip("/")
+        self.rng = random.Random(args.seed)
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+        self.event_lags: Dict[str, List[float]] = {"queue_status": [], "transcriptions_update": []}
+        self.event_counts: Dict[str, int] = {"queue_status": 0, "transcriptions_update": 0}
+        self.job_ids: List[str] = []
+        self._stop = threading.Event()
+
+    def _record(self, endpoint: str, status, elapsed: float):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(elapsed)
+            counts = self.statuses.setdefault(endpoint, {})
+            counts[str(status)] = counts.get(str(status), 0) + 1
+
+    def request(self, endpoint: str, url: str, data: Optional[bytes] = None, headers: Optional[dict] = None) -> Tuple[int, bytes]:
+        req = urllib.request.Request(self.base_url + url, data=data, headers=headers or {})
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=self.args.timeout) as response:
+                body = response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            body = e.read()
+            status = e.code
+        except Exception as e:
+            self._record(endpoint, type(e).__name__, time.perf_counter() - started)
+            return 0, b""
+        self._record(endpoint, status, time.perf_counter() - started)
+        return status, body
+
+    # --- audio ---------------------------------------------------------------
+
+    def prepare_files(self, folder: str) -> List[str]:
+        paths = []
+        low, high = self.args.min_seconds, self.args.max_seconds
+        for n in range(self.args.uploads):
+            path = os.path.join(folder, f"load_{self.args.seed}_{n:04d}.wav")
+            seconds = self.rng.uniform(low, high)
+            if not os.path.exists(path):
+                generate_wav(path, seconds, random.Random(f"{self.args.seed}-{n}"))
+            paths.append(path)
+        return paths
+
+    # --- traffico --------------------------------------------------------------
+
+    def upload(self, path: str):
+        with open(path, "rb") as f:
+            data = f.read()
+        body, content_type = encode_multipart(
+            {"model": self.args.model, "language": "it", "vad_filter": "on"},
+            [("files", os.path.basename(path), data)]
+        )
+        status, response = self.request("POST /transcribe", "/transcribe", body, {"Content-Type": content_type})
+        if status == 200:
+            for result in json.loads(response).get("results", []):
+                if result.get("success"):
+                    with self._lock:
+                        self.job_ids.append(result["id"])
+
+    def read_traffic(self):
+        """Elenco e download delle trascrizioni finché il test non termina."""
+        rng = random.Random(self.args.seed + 1)
+        while not self._stop.is_set():
+            status, body = self.request("GET /transcription", "/transcription")
+            ids = [t["id"] for t in json.loads(body)] if status == 200 else []
+            if ids:
+                trans_id = rng.choice(ids)
+                self.request("GET /transcription/<id>/download", f"/transcription/{trans_id}/download",
+                             headers={"Accept-Encoding": "gzip"})
+            self._stop.wait(self.args.read_interval)
+
+    def socket_client(self, index: int, ready: threading.Barrier):
+        try:
+            import socketio
+        except ImportError:
+            print("python-socketio[client] non installato: client Socket.IO disattivati")
+            ready.abort()
+            return
+
+        client = socketio.Client(reconnection=False)
+
+        def handler(event: str):
+            def on_event(data):
+                received = time.time()
+                with self._lock:
+                    self.event_counts[event] += 1
+                    if isinstance(data, dict) and "sent_at" in data:
+                        self.event_lags[event].append(max(0.0, received - data["sent_at"]))
+            return on_event
+
+        client.on("queue_status", handler("queue_status"))
+        client.on("transcriptions_update", handler("transcriptions_update"))
+        started = time.perf_counter()
+        try:
+            client.connect(self.base_url, transports=["websocket", "polling"])
+        except Exception as e:
+            self._record("socket connect", type(e).__name__, time.perf_counter() - started)
+            ready.abort()
+            return
+        self._record("socket connect", "ok", time.perf_counter() - started)
+        try:
+            ready.wait()
+        except threading.BrokenBarrierError:
+            pass
+        self._stop.wait()
+        client.disconnect()
+
+    def wait_for_jobs(self):
+        deadline = time.time() + self.args.job_timeout
+        while time.time() < deadline:
+            status, body = self.request("GET /transcription", "/transcription")
+            if status == 200:
+                done = {t["id"] for t in json.loads(body) if t.get("status", "completed") == "completed"}
+                with self._lock:
+                    pending = [i for i in self.job_ids if i not in done]
+                if not pending:
+                    return True
+            time.sleep(1)
+        return False
+
+    def run(self) -> dict:
+        folder = self.args.audio_dir or os.path.join(tempfile.gettempdir(), "whisper_load_audio")
+        os.makedirs(folder, exist_ok=True)
+        files = self.prepare_files(folder)
+
+        ready = threading.Barrier(self.args.socket_clients + 1) if self.args.socket_clients else None
+        socket_threads = []
+        for n in range(self.args.socket_clients):
+            thread = threading.Thread(target=self.socket_client, args=(n, ready), daemon=True)
+            thread.start()
+            socket_threads.append(thread)
+        if ready is not None:
+            try:
+                ready.wait(timeout=60)
+            except threading.BrokenBarrierError:
+                pass
+
+        readers = [threading.Thread(target=self.read_traffic, daemon=True) for _ in range(self.args.readers)]
+        for thread in readers:
+            thread.start()
+
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as executor:
+            list(executor.map(self.upload, files))
+        upload_seconds = time.time() - started
+
+        all_done = self.wait_for_jobs()
+        total_seconds = time.time() - started
+        self._stop.set()
+        for thread in readers + socket_threads:
+            thread.join(timeout=10)
+
+        return {
+            "config": {k: v for k, v in vars(self.args).items() if k != "output"},
+            "jobs": {"submitted": len(files), "accepted": len(self.job_ids), "all_completed": all_done},
+            "upload_seconds": round(upload_seconds, 2),
+            "total_seconds": round(total_seconds, 2),
+            "requests": {
+                endpoint: {**percentiles(values), "statuses": self.statuses.get(endpoint, {})}
+                for endpoint, values in sorted(self.latencies.items())
+            },
+            "events": {
+                event: {
+                    "received": self.event_counts[event],
+                    "per_client": round(self.event_counts[event] / max(1, self.args.socket_clients), 1),
+                    "lag_ms": percentiles(self.event_lags[event]),
+                }
+                for event in self.event_counts
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test di carico del web server di trascrizione")
+    parser.add_argument("--url", default="http://127.0.0.1:12345")
+    parser.add_argument("--uploads", type=int, default=20, help="numero di file da caricare")
+    parser.add_argument("--concurrency", type=int, default=4, help="upload concorrenti")
+    parser.add_argument("--socket-clients", type=int, default=20, help="client Socket.IO connessi")
+    parser.add_argument("--readers", type=int, default=2, help="thread di traffico elenco/download")
+    parser.add_argument("--read-interval", type=float, default=0.5)
+    parser.add_argument("--min-seconds", type=float, default=30)
+    parser.add_argument("--max-seconds", type=float, default=180)
+    parser.add_argument("--model", default="tiny")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--job-timeout", type=float, default=3600)
+    parser.add_argument("--audio-dir", default=None, help="cartella dei WAV generati (riusati tra esecuzioni)")
+    parser.add_argument("--output", default=None, help="file JSON del report")
+    args = parser.parse_args()
+
+    report = LoadTest(args).run()
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,19 +3,29 @@ import sys
 import tempfile
 import threading
 import time
-from typing import Callable, List
+from typing import Callable, List, Optional
 import uuid
 import json
+import math
 from datetime import datetime
-from flask import Flask, request, jsonify, render_template, send_file, redirect, url_for
+from flask import Flask, Response, request, jsonify, render_template, send_file, redirect, url_for, stream_with_context
 from flask_socketio import SocketIO, emit
 import torch
 from werkzeug.utils import secure_filename
 from concurrent.futures import ThreadPoolExecutor
 import logging
+import zipfile
+import dataclasses
 
 from Transcriber import Transcription
-from Transcriber import QueueItem, Transcriber
+from Transcriber import QueueItem, Transcriber, SWEEP_PARAMETERS, sweep_summary_path
+import TranscriptStorage
+from Ingest import is_allowed_audio, resolve_source
+from FolderWatcher import FolderWatcher, load_watch_config
+from AudioStream import probe_duration
+from Performance import PerformanceModel
+from Engines import ENGINES, describe_engines, engine_for
+import updateChecker
 from Setting import *
 
 
@@ -26,29 +36,44 @@ logger.info(f"torch backends cudnn version: {torch.backends.cudnn.version()}")
 
 
 class WebServer:
-    def __init__(self, host='0.0.0.0', port=12345):
+    def __init__(self, host='0.0.0.0', port=12345, debug=True):
         
         
         self._modelName = 'small'
+        self._debug = debug
         
         
         #queue per l'elaborazione in background
         self._queueLock = threading.Lock()
         self._queue: List[QueueItem] = []
-        self._maxQueue = 20
-        
-        # Avvia il thread di elaborazione
-        self._processing_thread = threading.Thread(target=self._process_queue, daemon=True)
-        self._processing_thread.start()
+        # segnala al thread di elaborazione che ci sono nuovi elementi
+        self._queueEvent = threading.Event()
+        # attivo durante un aggiornamento: i job continuano a essere accodati ma non ne vengono avviati di nuovi
+        self._draining = threading.Event()
+        # richieste di invio dello stato della coda, accorpate dal thread _publish_queue_status
+        self._statusRequested = threading.Event()
         
         self._Transcriber = Transcriber()
+        # stime dei tempi di elaborazione per l'ammissione e le previsioni della coda
+        self._performance = PerformanceModel("cuda" if torch.cuda.is_available() else "cpu")
+        # misura della durata dei file accodati tramite batch e cartelle monitorate
+        self._probe_executor = ThreadPoolExecutor(max_workers=4)
+        # analisi del parlato (VAD) degli elementi in coda, nell'ordine di arrivo
+        self._speech_executor = ThreadPoolExecutor(max_workers=1)
         
         # Memoria delle trascrizioni
         self._transcriptions = {t.id: t for t in Transcription.load_transcriptions(TRANSCRIPTIONS_DIR)}
         
-        for filename in os.listdir(tempfile.gettempdir()):
-            if os.path.isfile(os.path.join(tempfile.gettempdir(), filename)) and filename.endswith(tuple(ALLOWED_EXTENSIONS)):
-                os.remove(os.path.join(tempfile.gettempdir(), filename))
+        # Coda lasciata dalla versione precedente durante un aggiornamento (solo nel processo che serve le richieste)
+        resumed_files = set()
+        if self._is_serving_process():
+            self._resume_queue()
+            resumed_files = {item.file_path for item in self._queue}
+        
+            for filename in os.listdir(tempfile.gettempdir()):
+                path = os.path.join(tempfile.gettempdir(), filename)
+                if os.path.isfile(path) and filename.endswith(tuple(ALLOWED_EXTENSIONS)) and path not in resumed_files:
+                    os.remove(path)
             
         
         self._app: Flask = Flask(__name__)
@@ -57,6 +82,10 @@ class WebServer:
         
         self._app.route('/', methods=['GET'])(self.index)
         self._app.route('/transcribe', methods=['POST'])(self.transcribe)
+        self._app.route('/batch', methods=['POST'])(self.batch_transcribe)
+        self._app.route('/sweep', methods=['POST'])(self.sweep)
+        self._app.route('/sweep/<item_id>', methods=['GET'])(self.get_sweep_summary)
+        self._app.route('/transcription/export', methods=['GET', 'POST'])(self.export_transcriptions)
         self._app.route('/transcription', methods=['GET'])(self.get_transcriptions)
         self._app.route('/transcription/<trans_id>', methods=['GET'])(self.get_transcription)
         self._app.route('/transcription/<trans_id>', methods=['PUT'])(self.rename_transcription)
@@ -71,7 +100,175 @@ class WebServer:
         self._socketio.on('get_queue_status')(self._send_queue_status)
         self._socketio.on('get_transcriptions')(self._send_transcriptions)
         
-        self._socketio.run(self._app, host=host, port=port, debug=True, allow_unsafe_werkzeug=True)
+        # Avvia il thread di elaborazione
+        self._processing_thread = threading.Thread(target=self._process_queue, daemon=True)
+        self._processing_thread.start()
+        # Invio dello stato della coda fuori dal thread di trascrizione
+        self._status_thread = threading.Thread(target=self._publish_queue_status, daemon=True)
+        self._status_thread.start()
+        
+        # Cartelle monitorate (solo nel processo che serve le richieste, non nel reloader)
+        self._watcher = None
+        if self._is_serving_process():
+            try:
+                folders = load_watch_config()
+            except Exception as e:
+                logger.error(f"Configurazione cartelle monitorate non valida: {e}")
+                folders = []
+            if folders:
+                self._watcher = FolderWatcher(
+                    folders,
+                    enqueue=lambda items: self._enqueue(items, BATCH_MAX_QUEUE),
+                    parse_parameters=self._parse_job_parameters
+                )
+                self._watcher.start()
+        
+        # Controllo periodico degli aggiornamenti con passaggio di consegne della coda
+        if self._is_serving_process() and AUTO_UPDATE_INTERVAL > 0:
+            threading.Thread(target=self._update_loop, daemon=True).start()
+        
+        self._socketio.run(self._app, host=host, port=port, debug=self._debug, allow_unsafe_werkzeug=True)
+    
+    def _is_serving_process(self) -> bool:
+        """Con debug attivo il reloader di werkzeug esegue l'app in un processo figlio: i servizi in background partono solo lì."""
+        return not self._debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+    
+    def _persist_queue(self):
+        """Salva gli elementi in attesa per la versione successiva. Da chiamare con _queueLock."""
+        pending = [dataclasses.asdict(item) for item in self._queue if item.status == "pending"]
+        TranscriptStorage.write_text_atomic(QUEUE_STATE_PATH, json.dumps(pending, indent=2))
+        logger.info(f"💾 Coda salvata: {len(pending)} elementi in attesa.")
+    
+    def _resume_queue(self):
+        """Riprende la coda salvata prima di un aggiornamento."""
+        if not os.path.exists(QUEUE_STATE_PATH):
+            return
+        
+        try:
+            with open(QUEUE_STATE_PATH, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Coda salvata non leggibile: {e}")
+            saved = []
+        
+        # i campi sconosciuti (versione diversa) vengono ignorati
+        known = {f.name for f in dataclasses.fields(QueueItem)}
+        for data in saved:
+            item = QueueItem(**{k: v for k, v in data.items() if k in known})
+            if not os.path.exists(item.file_path):
+                logger.error(f"File non più disponibile, elemento scartato: {item.file_path}")
+                continue
+            item.status = "pending"
+            item.progress = 0
+            # la bozza già prodotta verrà sostituita dalla passata finale
+            if item.is_refine and item.id in self._transcriptions:
+                self._transcriptions[item.id].status = "draft"
+            self._queue.append(item)
+        
+        self._schedule_speech_maps(self._queue)
+        # elementi salvati prima che la misura della durata in background terminasse
+        for item in self._queue:
+            if item.duration is None:
+                self._probe_executor.submit(self._probe_item, item)
+        os.remove(QUEUE_STATE_PATH)
+        logger.info(f"▶️ Coda ripresa: {len(self._queue)} elementi.")
+    
+    def _update_loop(self):
+        while True:
+            time.sleep(AUTO_UPDATE_INTERVAL)
+            try:
+                branch = updateChecker.update_available(".")
+                if branch:
+                    self._handoff_update(branch)
+            except Exception:
+                logger.exception("Errore durante il controllo aggiornamenti")
+    
+    def _handoff_update(self, branch: str):
+        """
+        Sospende l'avvio di nuovi job, attende la fine di quello in corso, aggiorna il
+        codice, salva la coda e riavvia il processo sullo stesso socket. I nuovi job
+        continuano a essere accodati: la coda salvata li passa alla nuova versione.
+        """
+        logger.info("🟡 Aggiornamento disponibile: attendo la fine del job in corso.")
+        self._draining.set()
+        self._send_queue_status()
+        
+        limit = time.time() + UPDATE_DRAIN_TIMEOUT
+        while True:
+            with self._queueLock:
+                if not any(q.status == "processing" for q in self._queue):
+                    break
+            if time.time() > limit:
+                logger.warning("Job in corso non terminato in tempo: aggiornamento rimandato.")
+                self._resume_processing()
+                return
+            time.sleep(1)
+        
+        if not updateChecker.pull_updates(os.path.abspath("."), branch):
+            self._resume_processing()
+            return
+        
+        # la coda viene salvata a ridosso del riavvio, tenendo il lock: nessun elemento accodato dopo va perso
+        with self._queueLock:
+            self._persist_queue()
+            restart_program()
+    
+    def _resume_processing(self):
+        self._draining.clear()
+        self._queueEvent.set()
+        self._send_queue_status()
+    
+    def _schedule_speech_maps(self, items: List[QueueItem]):
+        """Avvia in background il calcolo della mappa del parlato degli elementi appena accodati."""
+        for item in items:
+            if item.vad_filter and item.speech_seconds is None:
+                self._speech_executor.submit(self._prepare_speech_map, item)
+    
+    def _prepare_speech_map(self, item: QueueItem):
+        # elemento già avviato o rimosso: se serve, la mappa la calcola il trascrittore
+        if item.status != "pending" or not any(q is item for q in self._queue):
+            return
+        self._Transcriber.prepare(item)
+        # le previsioni della coda ora usano i secondi di parlato
+        self._request_queue_status()
+    
+    def _probe_item(self, item: QueueItem):
+        duration = self._safe_probe(item.file_path)
+        with self._queueLock:
+            item.duration = duration
+            if item.model_name == "auto" and item.status == "pending":
+                self._select_models([item])
+        self._request_queue_status()
+    
+    @staticmethod
+    def _safe_probe(path: str) -> Optional[float]:
+        try:
+            return probe_duration(path)
+        except Exception as e:
+            logger.error(f"Impossibile leggere la durata di {path}: {str(e)}")
+            return None
+    
+    def _enqueue(self, items: List[QueueItem], limit: int) -> List[QueueItem]:
+        """
+        Accoda quanti più elementi possibile senza superare limit elementi attivi; ritorna quelli accettati.
+        L'ammissione è per numero di elementi: la durata viene misurata dopo, in background, e
+        gli elementi con model=auto ricevono il modello solo allora.
+        """
+        with self._queueLock:
+            total = sum(1 for q in self._queue if q.status in ['pending', 'processing'])
+            accepted = items[:max(0, limit - total)]
+            self._select_models([item for item in accepted if item.duration is not None])
+            self._queue.extend(accepted)
+            self._schedule_speech_maps(accepted)
+        
+        for item in accepted:
+            if item.duration is None:
+                self._probe_executor.submit(self._probe_item, item)
+        
+        if accepted:
+            self._queueEvent.set()
+            self._send_queue_status()
+        return accepted
     
     def remove_from_queue(self, item_id):
         logger.info(f"removing item {item_id} from queue")
@@ -84,10 +281,12 @@ class WebServer:
                     
                     found = True
                     self._queue.pop(i)
-                    try:  
-                        os.remove(item.file_path) 
-                    except:
-                        pass
+                    if item.owns_file:
+                        try:  
+                            os.remove(item.file_path) 
+                        except:
+                            pass
+                    break
 
         if found:            
             # Notifica i client
@@ -116,10 +315,11 @@ class WebServer:
             # Rimuovi il file temporaneo se esiste
             with self._queueLock:
                 self._queue.pop(item_index)
-                try:
-                    os.remove(item_to_stop.file_path)
-                except:
-                    pass
+                if item_to_stop.owns_file:
+                    try:
+                        os.remove(item_to_stop.file_path)
+                    except:
+                        pass
             
             self._send_queue_status()
             return jsonify({"success": True})
@@ -136,7 +336,8 @@ class WebServer:
         
     def _send_queue_status(self):
         with self._queueLock:
-            queue_status = [item.to_dict() for item in self._queue]
+            schedule = self._queue_schedule()
+            queue_status = [{**item.to_dict(), **schedule.get(item.id, {})} for item in self._queue]
         
         # Ottieni informazioni sul device corrente
         current_device = self._Transcriber.get_current_device()
@@ -148,12 +349,29 @@ class WebServer:
             'transcriber_status': self._Transcriber.getCurrentStatus(),
             'current_file': self._Transcriber.getCurrentFile(),
             'current_device': current_device,
-            'gpu_available': torch.cuda.is_available()
+            'gpu_available': torch.cuda.is_available(),
+            'updating': self._draining.is_set(),
+            'sent_at': time.time()
         })
         
+    def _request_queue_status(self):
+        """Richiede un invio dello stato della coda senza attenderlo (usato durante la trascrizione)."""
+        self._statusRequested.set()
+        
+    def _publish_queue_status(self):
+        # più richieste ravvicinate producono un solo invio ogni PROGRESS_UPDATE_INTERVAL
+        while True:
+            self._statusRequested.wait()
+            self._statusRequested.clear()
+            try:
+                self._send_queue_status()
+            except Exception:
+                logger.exception("Errore invio stato della coda")
+            time.sleep(PROGRESS_UPDATE_INTERVAL)
+        
     def _send_transcriptions(self):
         transcriptions = [t.to_dict() for t in self._transcriptions.values()]
-        self._socketio.emit('transcriptions_update', {'transcriptions': transcriptions})
+        self._socketio.emit('transcriptions_update', {'transcriptions': transcriptions, 'sent_at': time.time()})
             
         
     def load_available_transcriptions(self):
@@ -162,7 +380,7 @@ class WebServer:
                 data = filename
     
     def allowed_file(self, filename) -> bool:
-        return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS   
+        return is_allowed_audio(filename)
 
 
     def on_transcription_complete(self, **data):
@@ -172,38 +390,78 @@ class WebServer:
     def _process_queue(self):
         while True:
             
-            # Attendi prima di controllare di nuovo la coda
-            time.sleep(2)
-            
             with self._queueLock:
-                if self._queue:
-                    item = self._queue[0]
-                    
-                    if item.status == "completed" or item.status == "error":
-                        self._queue.pop(0)
-                        self._queue.append(item)
-                        continue
-                    
+                item = self._next_item()
+                if item is not None:
                     item.status = "processing"
-                else:
-                    continue
+            
+            if item is None:
+                # Attendi nuovi elementi prima di controllare di nuovo la coda
+                self._queueEvent.wait(2)
+                self._queueEvent.clear()
+                continue
             
             self._send_queue_status()
             
             if item is not None and isinstance(item, QueueItem):
                 try:
                     # Processa il file
+                    model = item.active_model
+                    outcome = "completed"
                     
-                    self._transcriptions[item.id] = self._Transcriber.transcribe(
-                        self._queueLock, item, updateFunc=lambda: self._send_queue_status()
-                    )
-                    
+                    if item.sweep_configs:
+                        # una trascrizione per configurazione, stesso audio decodificato una volta
+                        transcriptions = self._Transcriber.transcribe_sweep(
+                            self._queueLock, item, updateFunc=self._request_queue_status
+                        )
+                        for transcription in transcriptions:
+                            self._transcriptions[transcription.id] = transcription
+                        if transcriptions and transcriptions[0].status == "completed":
+                            self._record_performance(item, model)
+                        if not transcriptions or transcriptions[0].status != "completed":
+                            outcome = "error"
+                    else:
+                        transcription = self._Transcriber.transcribe(
+                            self._queueLock, item, updateFunc=self._request_queue_status
+                        )
+                        
+                        # misura del fattore real-time per le stime successive
+                        if transcription.status == "completed":
+                            self._record_performance(item, model)
+
+                        if item.phase == "draft" and transcription.status != "stopped":
+                            self._complete_draft(item, transcription)
+                            continue
+
+                        previous = self._transcriptions.get(item.id)
+                        if previous is not None and previous.status == "draft" and transcription.status != "completed":
+                            # passata finale fallita o fermata: resta la bozza, il file parziale viene scartato
+                            logger.error(f"Passata finale non completata per {item.filename}, resta la bozza")
+                            if previous.file_path != transcription.file_path:
+                                self._remove_transcription_file(transcription)
+                        else:
+                            # la versione finale sostituisce l'eventuale bozza
+                            self._transcriptions[item.id] = transcription
+                            if previous is not None and previous.status == "draft" and previous.file_path != transcription.file_path:
+                                self._remove_transcription_file(previous)
+                        
+                        if transcription.status != "completed":
+                            outcome = "error"
+
+                        # copia nell'albero di output della cartella monitorata
+                        if item.output_path and transcription.status == "completed":
+                            try:
+                                TranscriptStorage.export_plain(transcription.file_path, item.output_path)
+                            except Exception as e:
+                                logger.error(f"Errore scrittura output {item.output_path}: {str(e)}")
+                        
                     self._send_transcriptions()
                     
                     # Aggiorna lo stato della coda
                     with self._queueLock:
-                        item.status = "completed"
-                        item.progress = 100
+                        item.status = outcome
+                        if outcome == "completed":
+                            item.progress = 100
                         
                     self._send_queue_status()
                     
@@ -217,10 +475,11 @@ class WebServer:
                     self._send_queue_status()
                 
                 # Rimuovi il file temporaneo
-                try:
-                    os.remove(item.file_path)
-                except:
-                    pass
+                if item.owns_file:
+                    try:
+                        os.remove(item.file_path)
+                    except:
+                        pass
                 
          
                 self._send_queue_status()
@@ -234,6 +493,66 @@ class WebServer:
                 
 
 
+    def _record_performance(self, item: QueueItem, model: str):
+        """
+        Aggiorna il fattore real-time con l'audio effettivamente decodificato e il solo
+        tempo di decodifica (esclusi caricamento del modello, probe e VAD; solo esecuzioni completate).
+        """
+        engine = engine_for(model, item.engine)
+        # i tempi del motore stub sono sintetici e falserebbero le stime dei modelli reali
+        if engine == "stub":
+            return
+        # sweep con encoder condiviso: ogni configurazione esegue solo il decoder, non è il costo di un job
+        if item.sweep_configs and ENGINES[engine].capabilities.shared_encoding:
+            return
+        processed, elapsed = self._Transcriber.get_decode_measure()
+        if processed > 0:
+            self._performance.record(model, processed, elapsed)
+    
+    def _next_item(self) -> Optional[QueueItem]:
+        """
+        Primo elemento in attesa (quelli completati restano in coda fino alla rimozione ritardata).
+        Le passate finali degli elementi con bozza vengono eseguite solo quando non ci sono
+        altri elementi in attesa, così ogni utente riceve prima la propria bozza. Da chiamare con _queueLock.
+        """
+        if self._draining.is_set():
+            return None
+        
+        refine = None
+        for q in self._queue:
+            # model=auto: il modello viene scelto quando la durata (misurata in background) è nota
+            if q.status != "pending" or q.model_name == "auto":
+                continue
+            if not q.is_refine:
+                return q
+            if refine is None:
+                refine = q
+        return refine
+    
+    def _complete_draft(self, item: QueueItem, transcription: Transcription):
+        """Pubblica la bozza e rimette l'elemento in coda per la passata con il modello richiesto."""
+        if transcription.status == "completed":
+            transcription.status = "draft"
+            self._transcriptions[item.id] = transcription
+            self._send_transcriptions()
+        else:
+            logger.error(f"Bozza non riuscita per {item.filename}, procedo con il modello {item.model_name}")
+        
+        with self._queueLock:
+            item.phase = "final"
+            item.status = "pending"
+            item.progress = 0
+        
+        self._queueEvent.set()
+        self._send_queue_status()
+
+    @staticmethod
+    def _remove_transcription_file(transcription: Transcription):
+        try:
+            os.remove(transcription.file_path)
+        except OSError:
+            pass
+
     def delayed_item_removal(self, item: QueueItem, delay: int = 5):
         time.sleep(delay)
         with self._queueLock:
@@ -252,102 +571,21 @@ class WebServer:
 
 
 
-        # Parametri opzionali
-        language = request.form.get('language', None)
-        model_name = request.form.get('model', None)
-        
-        # Parametri base
-        add_info = 'add_info' in request.form
-        vad_filter = 'vad_filter' in request.form
-        beam_size = int(request.form.get('beam_size', 5))
-        
-        # Parametri avanzati
-        temperature = float(request.form.get('temperature', 0.0))
-        best_of = int(request.form.get('best_of', 5))
-        compression_ratio_threshold = float(request.form.get('compression_ratio_threshold', 2.4))
-        no_repeat_ngram_size = int(request.form.get('no_repeat_ngram_size', 0))
-        vad_min_silence = int(request.form.get('vad_min_silence', 1000))
-        patience = request.form.get('patience', None)
-        
-        # Converti patience in float se presente
-        if patience:
-            patience = float(patience)
-        
-        # Crea i parametri VAD
-        vad_parameters = {"min_silence_duration_ms": vad_min_silence}
+        try:
+            job_params = self._parse_job_parameters(request.form, form=True)
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": f"Parametri non validi: {str(e)}"}), 400
         
         results = []
+        items: List[QueueItem] = []
       
-
-        # Processa i file in parallelo
-        with self._queueLock:
-            
-            total = 0
-            for q in self._queue:
-                if q.status in ['pending', 'processing']:
-                    total += 1
-                    
-            if total + len(files) > self._maxQueue:
-                logger.error(f"Coda piena.")
-                return jsonify({
-                    "success": False,
-                    "error": f"Coda piena. Massimo {self._maxQueue} file contemporaneamente."
-                }), 429
-                
-            
-            for file in files:
-                if file and self.allowed_file(file.filename) and file.filename is not None:
-                    filename = secure_filename(file.filename)
-                    counter = 1
-                    
-                    temp_path = os.path.join(self._app.config['UPLOAD_FOLDER'], filename)
-
-                    if os.path.exists(temp_path):
-                        while True:
-                            name, ext = os.path.splitext(filename)
-                            new_filename = f"{name}({counter}){ext}"
-                            temp_path = os.path.join(self._app.config['UPLOAD_FOLDER'], new_filename)
-                            counter += 1
-                            if not os.path.exists(temp_path):
-                                filename = new_filename
-                                break
-                            
-                        temp_path = os.path.join(self._app.config['UPLOAD_FOLDER'], filename)
-                    
-
+        # Salva i file e ne misura la durata: serve per stimare il costo prima dell'ammissione
+        for file in files:
+            if file and self.allowed_file(file.filename) and file.filename is not None:
+                with self._queueLock:
+                    filename, temp_path = self._temp_upload_path(file.filename)
                     try:
                         file.save(temp_path)
-                        logger.info(f"File salvato temporaneamente in {temp_path}")
-                        #self._queue.append(temp_path)
-                        
-                        # Aggiungi alla coda
-                        item_id = str(uuid.uuid4())
-                        item = QueueItem(
-                            id=item_id,
-                            filename=filename,
-                            file_path=temp_path,
-                            language=language,
-                            model_name=model_name,
-                            add_info=add_info,
-                            vad_filter=vad_filter,
-                            beam_size=beam_size,
-                            temperature=temperature,
-                            best_of=best_of,
-                            compression_ratio_threshold=compression_ratio_threshold,
-                            no_repeat_ngram_size=no_repeat_ngram_size,
-                            vad_parameters=vad_parameters,
-                            patience=patience
-                        )
-                        
-                        logger.info(f"\n{'='*80}\nAggiunto alla coda:\n {item}\n{'='*80}")
-                        
-                        self._queue.append(item)
-                        results.append({
-                            "id": item_id,
-                            "filename": filename,
-                            "success": True
-                        })
-                        
                     except Exception as e:
                         logger.error(f"Errore salvataggio file {filename}: {str(e)}")
                         results.append({
@@ -355,14 +593,438 @@ class WebServer:
                             "success": False,
                             "error": f"Errore salvataggio: {str(e)}"
                         })
+                        continue
+                
+                logger.info(f"File salvato temporaneamente in {temp_path}")
+                item = QueueItem(
+                    id=str(uuid.uuid4()),
+                    filename=filename,
+                    file_path=temp_path,
+                    **job_params
+                )
+                try:
+                    item.duration = probe_duration(temp_path)
+                except Exception as e:
+                    logger.error(f"Impossibile leggere la durata di {filename}: {str(e)}")
+                    self._remove_item_file(item)
+                    results.append({
+                        "filename": filename,
+                        "success": False,
+                        "error": f"File audio non leggibile: {str(e)}"
+                    })
+                    continue
+                items.append(item)
+        
+        rejection = self._admit(items)
+        if rejection is not None:
+            return rejection
+        
+        with self._queueLock:
+            schedule = self._queue_schedule()
+        
+        for item in items:
+            logger.info(f"\n{'='*80}\nAggiunto alla coda:\n {item}\n{'='*80}")
+            results.append({
+                "id": item.id,
+                "filename": item.filename,
+                "model": item.model_name,
+                "success": True,
+                **schedule.get(item.id, {})
+            })
                 
         # Notifica i client
+        self._queueEvent.set()
         self._send_queue_status()  
                                    
         return jsonify({
             "success": True,
             "results": results
         })
+    
+    def _remove_item_file(self, item: QueueItem):
+        if item.owns_file:
+            try:
+                os.remove(item.file_path)
+            except OSError:
+                pass
+    
+    def _estimate_pass(self, item: QueueItem, model: str) -> float:
+        """Secondi di elaborazione stimati per una passata dell'elemento con il modello indicato."""
+        if item.work_seconds is None:
+            return 0.0
+        cost = self._performance.estimate(model, item.work_seconds)
+        if item.sweep_configs:
+            cost *= len(item.sweep_configs)
+        return cost
+    
+    def _queue_passes(self):
+        """
+        Passate ancora da eseguire nello stesso ordine di _next_item, come liste di
+        (elemento, secondi stimati): prima quelle in ordine di coda, poi le passate
+        finali degli elementi con bozza. Da chiamare con _queueLock.
+        """
+        first = []  # passate eseguite in ordine di coda
+        later = []  # passate finali degli elementi con bozza
+        for q in self._queue:
+            passes = q.remaining_passes()
+            if q.status == "processing":
+                first.insert(0, (q, self._estimate_pass(q, passes[0]) * (1 - q.progress / 100)))
+            elif q.status == "pending" and not q.is_refine:
+                first.append((q, self._estimate_pass(q, passes[0])))
+            elif q.status == "pending":
+                later.append((q, self._estimate_pass(q, passes[0])))
+                continue
+            else:
+                continue
+            for model in passes[1:]:
+                later.append((q, self._estimate_pass(q, model)))
+        return first, later
+    
+    def _queue_schedule(self) -> dict:
+        """
+        Simula l'esecuzione della coda e ritorna, per ogni elemento attivo, inizio e
+        fine previsti (epoch in secondi). Da chiamare con _queueLock.
+        """
+        first, later = self._queue_passes()
+        
+        schedule = {}
+        t = time.time()
+        for q, cost in first + later:
+            entry = schedule.setdefault(q.id, {'predicted_start': round(t, 1)})
+            t += max(0.0, cost)
+            entry['predicted_finish'] = round(t, 1)
+            if q.deadline is not None:
+                entry['deadline_met'] = t <= q.deadline
+        return schedule
+    
+    def _select_models(self, items: List[QueueItem]):
+        """
+        Sceglie il modello degli elementi con model=auto: il più accurato che termina entro
+        la scadenza considerando il lavoro già in coda, tutte le passate dell'elemento e,
+        per gli elementi con bozza, che la passata finale parte solo dopo le prime passate
+        di tutti gli altri elementi in attesa. Da chiamare con _queueLock.
+        """
+        # gli elementi da assegnare possono essere già in coda (durata misurata in background)
+        position = {id(q): i for i, q in enumerate(self._queue)}
+        first, later = self._queue_passes()
+        first = [(q, cost) for q, cost in first if not any(q is item for item in items)]
+        later_work = sum(max(0.0, cost) for q, cost in later if not any(q is item for item in items))
+        # prima passata degli elementi da assegnare, nell'ordine in cui verranno eseguiti
+        batch = sorted(items, key=lambda i: position.get(id(i), len(self._queue)))
+        
+        for n, item in enumerate(batch):
+            index = position.get(id(item), len(self._queue))
+            before = sum(max(0.0, cost) for q, cost in first if position.get(id(q), -1) < index)
+            before += sum(self._estimate_pass(i, i.remaining_passes()[0]) for i in batch[:n])
+            
+            if item.auto_model and item.model_name == "auto":
+                after = sum(max(0.0, cost) for q, cost in first if position.get(id(q), -1) > index)
+                after += sum(self._estimate_pass(i, i.remaining_passes()[0]) for i in batch[n + 1:])
+                
+                def finish_after(model: str, item=item, before=before, after=after) -> float:
+                    if item.draft_model and item.draft_model != model:
+                        # bozza in ordine di coda, passata finale dopo tutte le altre prime passate
+                        draft = self._estimate_pass(item, item.draft_model)
+                        return before + draft + after + later_work + self._estimate_pass(item, model)
+                    return before + self._estimate_pass(item, model)
+                
+                model, met = self._performance.choose_model(finish_after, item.deadline, item.min_model)
+                item.model_name = model
+                if item.draft_model == model:
+                    item.draft_model = None
+                    item.phase = "final"
+                logger.info(f"Modello scelto per {item.filename}: {model}" + ("" if met else " (scadenza non rispettabile)"))
+    
+    def _backlog_seconds(self) -> float:
+        """Lavoro arretrato stimato in secondi di elaborazione. Da chiamare con _queueLock."""
+        schedule = self._queue_schedule()
+        if not schedule:
+            return 0.0
+        return max(0.0, max(e['predicted_finish'] for e in schedule.values()) - time.time())
+    
+    def _admit(self, items: List[QueueItem]):
+        """
+        Accoda gli elementi se il lavoro arretrato stimato resta entro QUEUE_BUDGET_SECONDS.
+        Ritorna None se accodati, altrimenti la risposta di rifiuto (i file temporanei vengono eliminati).
+        """
+        with self._queueLock:
+            self._select_models(items)
+            cost = sum(self._estimate_pass(item, model) for item in items for model in item.remaining_passes())
+            backlog = self._backlog_seconds()
+            if backlog + cost <= QUEUE_BUDGET_SECONDS:
+                self._queue.extend(items)
+                self._schedule_speech_maps(items)
+                return None
+        
+        for item in items:
+            self._remove_item_file(item)
+        
+        if cost > QUEUE_BUDGET_SECONDS:
+            logger.error(f"Richiesta troppo onerosa: {cost:.0f}s stimati, budget {QUEUE_BUDGET_SECONDS:.0f}s.")
+            return jsonify({
+                "success": False,
+                "error": f"Elaborazione stimata di {int(cost)} secondi: supera il budget della coda ({int(QUEUE_BUDGET_SECONDS)} secondi)."
+            }), 413
+        
+        # il lavoro arretrato si smaltisce in tempo reale: si riprova quando c'è abbastanza spazio
+        retry_after = int(math.ceil(backlog + cost - QUEUE_BUDGET_SECONDS))
+        logger.error(f"Coda piena. Riprovare tra {retry_after}s.")
+        return jsonify({
+            "success": False,
+            "error": f"Coda piena. Riprova tra {retry_after} secondi.",
+            "retry_after": retry_after
+        }), 429, {"Retry-After": str(retry_after)}
+    
+    def _temp_upload_path(self, original_name: str):
+        """Nome sicuro e percorso libero nella cartella temporanea per un file caricato."""
+        filename = secure_filename(original_name)
+        counter = 1
+        
+        temp_path = os.path.join(self._app.config['UPLOAD_FOLDER'], filename)
+
+        if os.path.exists(temp_path):
+            while True:
+                name, ext = os.path.splitext(filename)
+                new_filename = f"{name}({counter}){ext}"
+                temp_path = os.path.join(self._app.config['UPLOAD_FOLDER'], new_filename)
+                counter += 1
+                if not os.path.exists(temp_path):
+                    filename = new_filename
+                    break
+                
+            temp_path = os.path.join(self._app.config['UPLOAD_FOLDER'], filename)
+        
+        return filename, temp_path
+    
+    def sweep(self):
+        """
+        Accoda un singolo file con più configurazioni di decodifica per lo stesso modello.
+        Form: file, parametri comuni come /transcribe e configs = lista JSON di
+        oggetti con beam_size, temperature, best_of, compression_ratio_threshold,
+        no_repeat_ngram_size e/o patience.
+        """
+        file = request.files.get('file')
+        if file is None or not file.filename:
+            return jsonify({"error": "Nessun file fornito"}), 400
+        if not self.allowed_file(file.filename):
+            return jsonify({"error": "Formato non supportato"}), 400
+        
+        try:
+            job_params = self._parse_job_parameters(request.form, form=True)
+            configs = self._parse_sweep_configs(request.form.get('configs', ''))
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": f"Parametri non validi: {str(e)}"}), 400
+        
+        with self._queueLock:
+            filename, temp_path = self._temp_upload_path(file.filename)
+            try:
+                file.save(temp_path)
+            except Exception as e:
+                logger.error(f"Errore salvataggio file {filename}: {str(e)}")
+                return jsonify({"success": False, "error": f"Errore salvataggio: {str(e)}"}), 500
+        
+        item = QueueItem(
+            id=str(uuid.uuid4()),
+            filename=filename,
+            file_path=temp_path,
+            sweep_configs=configs,
+            **job_params
+        )
+        try:
+            item.duration = probe_duration(temp_path)
+        except Exception as e:
+            self._remove_item_file(item)
+            return jsonify({"success": False, "error": f"File audio non leggibile: {str(e)}"}), 400
+        
+        rejection = self._admit([item])
+        if rejection is not None:
+            return rejection
+        
+        logger.info(f"Sweep di {len(configs)} configurazioni accodato: {filename}")
+        self._queueEvent.set()
+        self._send_queue_status()
+        
+        return jsonify({
+            "success": True,
+            "id": item.id,
+            "filename": filename,
+            "transcription_ids": [f"{item.id}-{k + 1}" for k in range(len(configs))]
+        })
+    
+    @staticmethod
+    def _parse_sweep_configs(raw: str) -> List[dict]:
+        configs = json.loads(raw) if raw else None
+        if not isinstance(configs, list) or not configs:
+            raise ValueError("'configs' deve essere una lista JSON non vuota")
+        if len(configs) > SWEEP_MAX_CONFIGS:
+            raise ValueError(f"Massimo {SWEEP_MAX_CONFIGS} configurazioni per sweep")
+        
+        parsed = []
+        for config in configs:
+            if not isinstance(config, dict):
+                raise ValueError("Ogni configurazione deve essere un oggetto")
+            unknown = set(config) - set(SWEEP_PARAMETERS)
+            if unknown:
+                raise ValueError(f"Parametri non ammessi nello sweep: {', '.join(sorted(unknown))}")
+            parsed.append({name: SWEEP_PARAMETERS[name](value) for name, value in config.items()})
+        return parsed
+    
+    def get_sweep_summary(self, item_id):
+        path = sweep_summary_path(item_id)
+        if not os.path.exists(path):
+            return jsonify({"error": "Riepilogo sweep non trovato"}), 404
+        with open(path, 'r', encoding='utf-8') as f:
+            return jsonify(json.load(f))
+    
+    @staticmethod
+    def _flag(params, name: str, default: bool = False) -> bool:
+        """Checkbox dei form (presente = attivo) oppure booleano JSON (assente = default)."""
+        value = params.get(name, None)
+        if value is None:
+            return default
+        if isinstance(value, str):
+            return value.lower() not in ('false', '0', 'off')
+        return bool(value)
+    
+    def _parse_job_parameters(self, params, form: bool = False) -> dict:
+        """
+        Legge i parametri di trascrizione da un form o da un dizionario JSON.
+        Nei form una checkbox non spuntata non viene inviata, quindi un flag
+        assente è falso; nei dizionari JSON vale il default del parametro.
+        """
+        
+        # Parametri avanzati
+        patience = params.get('patience', None)
+        
+        # Converti patience in float se presente
+        if patience:
+            patience = float(patience)
+        
+        # Modello veloce per la bozza (opzionale)
+        draft_model = params.get('draft_model', None)
+        if draft_model and draft_model not in SUPPORTED_MODELS:
+            raise ValueError(f"Modello bozza non supportato: {draft_model}")
+        
+        # Scadenza e qualità minima: con model=auto (o senza modello) il modello viene scelto all'ammissione
+        model_name = params.get('model', None) or None
+        deadline = self._parse_deadline(params)
+        min_model = params.get('min_model', None) or None
+        if min_model and min_model not in SUPPORTED_MODELS:
+            raise ValueError(f"Modello minimo non supportato: {min_model}")
+        if model_name is None and deadline is not None:
+            model_name = "auto"
+        if model_name is None:
+            raise ValueError("Modello non specificato")
+        if model_name == "auto":
+            if deadline is None and min_model is None:
+                raise ValueError("Il modello automatico richiede una scadenza o un modello minimo")
+        elif model_name not in SUPPORTED_MODELS:
+            raise ValueError(f"Modello non supportato: {model_name}")
+        
+        # Motore di trascrizione (opzionale, altrimenti quello configurato per il modello)
+        engine = params.get('engine', None) or None
+        if engine and engine not in ENGINES:
+            raise ValueError(f"Motore di trascrizione non supportato: {engine}")
+        
+        return {
+            # Parametri opzionali
+            'language': params.get('language', None),
+            'model_name': model_name,
+            'deadline': deadline,
+            'min_model': min_model,
+            # Parametri base
+            'add_info': self._flag(params, 'add_info'),
+            'vad_filter': self._flag(params, 'vad_filter', default=not form),
+            'beam_size': int(params.get('beam_size', 5)),
+            # Parametri avanzati
+            'temperature': float(params.get('temperature', 0.0)),
+            'best_of': int(params.get('best_of', 5)),
+            'compression_ratio_threshold': float(params.get('compression_ratio_threshold', 2.4)),
+            'no_repeat_ngram_size': int(params.get('no_repeat_ngram_size', 0)),
+            # Crea i parametri VAD
+            'vad_parameters': {"min_silence_duration_ms": int(params.get('vad_min_silence', 1000))},
+            'patience': patience or None,
+            'draft_model': draft_model or None,
+            'engine': engine,
+        }
+    
+    @staticmethod
+    def _parse_deadline(params) -> Optional[float]:
+        """Scadenza come epoch: deadline_seconds / deadline_minutes relativi ad ora oppure deadline in ISO 8601."""
+        if params.get('deadline_seconds'):
+            return time.time() + float(params.get('deadline_seconds'))
+        if params.get('deadline_minutes'):
+            return time.time() + float(params.get('deadline_minutes')) * 60
+        if params.get('deadline'):
+            # senza fuso orario si intende l'ora locale del server
+            return datetime.fromisoformat(str(params.get('deadline'))).timestamp()
+        return None
+    
+    def batch_transcribe(self):
+        """
+        Accoda molti file già presenti sul server senza caricarli né copiarli.
+        Body JSON: {"defaults": {<parametri>}, "items": [{"source": <percorso|file://|store://>, "display_name"?: ..., <parametri>}]}
+        """
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data.get('items'), list) or not data['items']:
+            return jsonify({"error": "Manifest non valido: 'items' mancante o vuoto"}), 400
+        
+        defaults = data.get('defaults') or {}
+        if not isinstance(defaults, dict):
+            return jsonify({"error": "Manifest non valido: 'defaults' deve essere un oggetto"}), 400
+        
+        results = []
+        items: List[QueueItem] = []
+        
+        for entry in data['items']:
+            if isinstance(entry, str):
+                entry = {'source': entry}
+            source = entry.get('source') if isinstance(entry, dict) else None
+            try:
+                path = resolve_source(source)
+                job_params = self._parse_job_parameters({**defaults, **entry})
+            except (TypeError, ValueError) as e:
+                results.append({"source": source, "success": False, "error": str(e)})
+                continue
+            
+            item = QueueItem(
+                id=str(uuid.uuid4()),
+                filename=entry.get('display_name') or os.path.basename(path),
+                file_path=path,
+                owns_file=False,
+                **job_params
+            )
+            items.append(item)
+            results.append({"source": source, "id": item.id, "filename": item.filename, "success": True})
+        
+        accepted = self._enqueue(items, BATCH_MAX_QUEUE)
+        
+        # modello scelto (per model=auto) e tempi previsti
+        with self._queueLock:
+            schedule = self._queue_schedule()
+        models = {item.id: item.model_name for item in accepted}
+        for result in results:
+            if result.get('id') in models:
+                result['model'] = models[result['id']]
+                result.update(schedule.get(result['id'], {}))
+        
+        # gli elementi oltre il limite vengono segnalati come rifiutati
+        rejected_ids = {item.id for item in items[len(accepted):]}
+        if rejected_ids:
+            logger.error(f"Coda piena: {len(rejected_ids)} elementi del batch rifiutati.")
+            for result in results:
+                if result.get('id') in rejected_ids:
+                    result.pop('id')
+                    result['success'] = False
+                    result['error'] = f"Coda piena. Massimo {BATCH_MAX_QUEUE} file contemporaneamente."
+        
+        logger.info(f"Batch: {len(accepted)} elementi accodati, {len(results) - len(accepted)} rifiutati.")
+        
+        return jsonify({
+            "success": len(accepted) > 0,
+            "queued": len(accepted),
+            "results": results
+        })
         
 
     def get_transcriptions(self):
@@ -374,7 +1036,7 @@ class WebServer:
             
             
             try:
-                with open(trans.file_path, 'r', encoding='utf-8') as f:
+                with TranscriptStorage.open_text(trans.file_path) as f:
                     text = f.read()
                 return jsonify({
                     'id': trans_id,
@@ -407,6 +1069,7 @@ class WebServer:
             'index.html', 
             languages=SUPPORTED_LANGUAGES,
             models=SUPPORTED_MODELS,
+            engines=[name for name, engine in ENGINES.items() if engine.available()],
             transcriptions= [t.to_dict() for t in self._transcriptions.values()],
             gpu_available=torch.cuda.is_available()
         )
@@ -432,8 +1095,23 @@ class WebServer:
         if trans_id in self._transcriptions:
             trans = self._transcriptions[trans_id]
             try:
+                encoding = TranscriptStorage.content_encoding_of(trans.file_path)
+                
+                # il client accetta la stessa codifica del file: si inviano i byte compressi così come sono
+                if encoding is not None and encoding in request.accept_encodings:
+                    response = send_file(
+                        trans.file_path,
+                        as_attachment=True,
+                        download_name=f"{trans.get_download_name()}",
+                        mimetype='text/plain'
+                    )
+                    response.headers['Content-Encoding'] = encoding
+                    response.headers['Vary'] = 'Accept-Encoding'
+                    return response
+                
+                # altrimenti si decomprime in streaming (nessuna copia in memoria del testo)
                 return send_file(
-                    trans.file_path,
+                    trans.file_path if encoding is None else TranscriptStorage.open_binary(trans.file_path),
                     as_attachment=True,
                     #download_name=f"{trans.file_path.split("/")[-1]}",#f"{trans.display_name}.txt",
                     download_name=f"{trans.get_download_name()}",
@@ -444,12 +1122,110 @@ class WebServer:
         
         return jsonify({"error": "Trascrizione non trovata"}), 404
         
+    def export_transcriptions(self):
+        """
+        Esporta più trascrizioni in un unico ZIP generato in streaming.
+        GET ?ids=id1,id2 oppure POST {"ids": [...]}; senza id vengono esportate tutte.
+        """
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            ids = data.get('ids') or []
+        else:
+            ids = [i for i in request.args.get('ids', '').split(',') if i]
+        
+        if not isinstance(ids, list):
+            return jsonify({"error": "'ids' deve essere una lista"}), 400
+        
+        if ids:
+            missing = [i for i in ids if i not in self._transcriptions]
+            if missing:
+                return jsonify({"error": "Trascrizioni non trovate", "missing": missing}), 404
+            selected = [self._transcriptions[i] for i in ids]
+        else:
+            selected = list(self._transcriptions.values())
+        
+        download_name = f"trascrizioni-{datetime.now().strftime('%Y%m%d-%H%M%S')}.zip"
+        return Response(
+            stream_with_context(_stream_zip(selected)),
+            mimetype='application/zip',
+            headers={'Content-Disposition': f'attachment; filename="{download_name}"'}
+        )
+        
     def health_check(self):
-        return jsonify({"status": "healthy", "model": self._modelName})
+        return jsonify({
+            "status": "healthy",
+            "model": self._modelName,
+            "engine": TRANSCRIPTION_ENGINE,
+            "model_engines": MODEL_ENGINES,
+            "engines": describe_engines(),
+            "real_time_factors": self._performance.snapshot()
+        })
+
+
+class _ZipStreamBuffer:
+    """Destinazione non seekable per zipfile: accumula i byte scritti finché il generatore non li preleva."""
+    
+    def __init__(self):
+        self._chunks: List[bytes] = []
+    
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def pop(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _stream_zip(transcriptions: List[Transcription], chunk_size: int = 64 * 1024):
+    """Genera lo ZIP a blocchi: in memoria resta al massimo un blocco compresso alla volta."""
+    buffer = _ZipStreamBuffer()
+    used_names = set()
+    
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for trans in transcriptions:
+            name = trans.get_download_name()
+            base, ext = os.path.splitext(name)
+            counter = 1
+            while name in used_names:
+                name = f"{base}({counter}){ext}"
+                counter += 1
+            used_names.add(name)
+            
+            try:
+                source = TranscriptStorage.open_binary(trans.file_path)
+            except OSError as e:
+                logger.error(f"Export: impossibile leggere {trans.file_path}: {e}")
+                continue
+            
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with source, archive.open(info, mode="w", force_zip64=True) as entry:
+                while True:
+                    chunk = source.read(chunk_size)
+                    if not chunk:
+                        break
+                    entry.write(chunk)
+                    data = buffer.pop()
+                    if data:
+                        yield data
+            yield buffer.pop()
+    
+    # directory centrale dell'archivio
+    yield buffer.pop()
 
 
 def restart_program():
     logger.info("♻️ Riavvio del programma con la nuova versione...")
+    # Se il server è già in ascolto, werkzeug ha esportato il socket (ereditabile) in
+    # WERKZEUG_SERVER_FD: il nuovo processo lo riusa invece di aprirne uno nuovo, così
+    # le connessioni in arrivo durante il riavvio attendono nel backlog invece di essere rifiutate.
+    if "WERKZEUG_SERVER_FD" in os.environ:
+        os.environ["WERKZEUG_RUN_MAIN"] = "true"
     python = sys.executable
     os.execv(python, [python] + sys.argv)
 
@@ -79,24 +79,32 @@ def pull_updates(cwd, branch="master") ->bool:
         logger.error(err)
         return False
 
-def auto_update(repo_path=".") -> bool:
-    """Funzione principale: verifica e aggiorna il codice."""
+def update_available(repo_path=".") -> Optional[str]:
+    """Ritorna il branch corrente se sul remoto ci sono aggiornamenti, altrimenti None (non esegue il pull)."""
     repo_path = os.path.abspath(repo_path)
     logger.info(f"📁 Repository: {repo_path}")
 
     if not check_git_available():
-        return False
+        return None
 
     if not check_repo(repo_path):
-        return False
+        return None
 
     branch = get_current_branch(repo_path)
     if not branch:
         logger.error("⚠️ Impossibile determinare il branch corrente.")
-        return False
+        return None
 
     if check_updates(repo_path, branch):
-        if pull_updates(repo_path, branch):
+        return branch
+    return None
+
+def auto_update(repo_path=".") -> bool:
+    """Funzione principale: verifica e aggiorna il codice."""
+    branch = update_available(repo_path)
+    
+    if branch:
+        if pull_updates(os.path.abspath(repo_path), branch):
             return True
     else:
         logger.info("🚀 Procedo con l'esecuzione normale...")